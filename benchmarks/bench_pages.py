@@ -0,0 +1,270 @@
+# Per-page frame time and SPI traffic benchmark.
+#
+# Drives WeatherDisplay, HourlyForecastDisplay and DailyForecastDisplay on the virtual
+# board (src/virtual_hw.py) with recorded onecall responses from fixtures/, through:
+#   full    - switching to the page from another page (complete redraw)
+#   tick    - the one-second incremental update
+#   refresh - a weather refresh, with the next recorded response
+# and reports wall time, CPU time, peak Python allocations, SPI bytes, SPI transactions
+# and modelled SPI wire time per stage as JSON. Before that, blocks partly off the screen
+# are drawn and what reaches the panel is checked (check_clipping).
+#
+#   python3 benchmarks/bench_pages.py                     # compare with baseline.json
+#   python3 benchmarks/bench_pages.py --update-baseline   # record a new baseline
+#
+# The run exits with status 1 if any stage regresses against the baseline by more than
+# the tolerance of the metric: SPI bytes and transactions (--traffic-tolerance), peak
+# allocations (--alloc-tolerance) and wall/CPU time (--time-tolerance). Times are the
+# fastest of the iterations, since noise from the rest of the machine only ever adds
+# to them; on top of the relative tolerance each stage gets TIME_ALLOWANCE_MS, as the
+# sub-millisecond stages are mostly timer resolution. Even the fastest of 15 runs moves
+# by about a third between runs on a busy shared machine, hence the 50% default; on a
+# quiet one, a smaller --time-tolerance works. Re-record the baseline on the machine the
+# check runs on.
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+bench_path = Path(__file__).resolve().parent
+sys.path.insert(0, str(bench_path.parent.joinpath("display_app")))
+
+from src import hal
+
+hw = hal.use_backend("virtual")
+
+from src import utils
+from src import weather_display, hourly_forecast, daily_forecast
+from src.http_client import JSONResponse
+from src.lib_tft24T import TFT24T, color565
+from src.weather_store import weather_store
+from src.room_sensor import room_sensor
+
+fixtures_path = bench_path.joinpath("fixtures")
+BASELINE_PATH = bench_path.joinpath("baseline.json")
+TIME_ALLOWANCE_MS = 0.5
+ALLOC_ALLOWANCE_KB = 2.0
+PAGE_MODULES = (weather_display, hourly_forecast, daily_forecast)
+
+
+class Clock(datetime):
+    # Stands in for datetime in the page modules, so every stage sees a chosen time
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+class Responses:
+    # Stands in for utils.get_weather_data, serving the recorded responses
+    def __init__(self, first):
+        self.current = first
+        self.calls = 0
+
+    def __call__(self, lat=None, lon=None, exclude=None, conditional=False):
+        self.calls += 1
+        return JSONResponse(200, self.current)
+
+
+def load_fixture(name):
+    with open(fixtures_path.joinpath(name)) as f:
+        return json.load(f)
+
+
+def install(responses, start):
+    Clock.current = start
+    for module in PAGE_MODULES:
+        module.datetime = Clock
+    # Fetched by the shared WeatherStore
+    utils.get_weather_data = responses
+
+
+def measure(TFT, stage, iterations, prepare=None):
+    """Run prepare() (not measured) and stage() "iterations" times; one extra run traces memory."""
+    panel = hw.board.panel
+    walls = []
+    cpus = []
+    traffic = None
+    for i in range(iterations + 1):
+        if prepare is not None:
+            prepare()
+        TFT.flush()
+        panel.stats.reset()
+        if i == iterations:
+            tracemalloc.start()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        stage()
+        TFT.flush()
+        if i == iterations:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            walls.append(time.perf_counter() - wall)
+            cpus.append(time.process_time() - cpu)
+            traffic = panel.stats.as_dict()
+    return {
+        "wall_ms": round(min(walls) * 1000, 3),
+        "cpu_ms": round(min(cpus) * 1000, 3),
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "spi_bytes": traffic["bytes"],
+        "spi_transactions": traffic["transactions"],
+        "spi_time_ms": round(traffic["transfer_time"] * 1000, 3),
+    }
+
+
+def check_clipping():
+    """Draw blocks that run past each edge of the screen. Returns what went wrong, if anything."""
+    TFT = TFT24T(hw.spidev.SpiDev(), hw.GPIO)
+    TFT.initLCD(24, 25, 15)
+    TFT.fill_rect(0, 0, TFT.width - 1, TFT.height - 1, (0, 0, 0))
+    failures = []
+    expected = np.zeros((TFT.height, TFT.width), dtype=np.uint16)
+    # (x0, y0, width, height): bottom right corner, top left corner, off the left, wholly off
+    blocks = [(200, 300, 60, 60), (-5, -3, 10, 10), (-10, 100, 20, 5), (TFT.width + 5, 0, 10, 10)]
+    for n, (x0, y0, width, height) in enumerate(blocks):
+        color = (255, 8 * n, 0)
+        try:
+            TFT.display_block(Image.new("RGB", (width, height), color), x0, y0, x0 + width - 1, y0 + height - 1)
+        except Exception as ex:
+            failures.append("clipping {}: {!r}".format((x0, y0, width, height), ex))
+            continue
+        expected[max(y0, 0):max(y0 + height, 0), max(x0, 0):max(x0 + width, 0)] = color565(color)
+    TFT.flush()
+    if not np.array_equal(hw.board.panel.framebuffer, expected):
+        failures.append("clipping: the panel does not show the blocks cut at the screen edges")
+    TFT.close()
+    return failures
+
+
+def run(iterations):
+    first = load_fixture("onecall_derry.json")
+    following = load_fixture("onecall_derry_next.json")
+    responses = Responses(first)
+    # A few minutes after the recorded response (so it counts as stale on the next
+    # refresh), at an odd minute so ticks do not refresh
+    start = datetime.utcfromtimestamp(first["current"]["dt"]).replace(second=1) + timedelta(minutes=3)
+    if start.minute % 2 == 0:
+        start += timedelta(minutes=1)
+    install(responses, start)
+    store = weather_store()
+    # Keep the recorded responses out of the snapshot on disk, and the calls out of the saved budget
+    store.snapshot_path = None
+    store.schedule.budget.path = None
+    # One reading of the simulated BME280 for the weather page, as the poller would publish
+    room_sensor().sample()
+
+    TFT = TFT24T(hw.spidev.SpiDev(), hw.GPIO)
+    TFT.initLCD(24, 25, 15)
+
+    pages = {
+        "weather": weather_display.WeatherDisplay(),
+        "hourly": hourly_forecast.HourlyForecastDisplay(),
+        "daily": daily_forecast.DailyForecastDisplay(),
+    }
+    names = list(pages)
+    results = {}
+    for n, name in enumerate(names):
+        page = pages[name]
+        other = pages[names[(n + 1) % len(names)]]
+
+        def switch_to_other():
+            # Show another page first, as when the user switches pages
+            store.publish(first)
+            Clock.current = start
+            other.invalidate()
+            other.draw(TFT)
+            page.invalidate()
+
+        def draw():
+            page.draw(TFT)
+
+        results[name + "/full"] = measure(TFT, draw, iterations, prepare=switch_to_other)
+
+        def next_second():
+            Clock.current += timedelta(seconds=1)
+            if Clock.current.second == 0:
+                Clock.current += timedelta(seconds=1)
+
+        results[name + "/tick"] = measure(TFT, lambda: (next_second(), page.draw(TFT)), iterations)
+
+        def before_refresh():
+            # Back to the first response on screen, one second before an even minute
+            store.publish(first)
+            Clock.current = start
+            page.invalidate()
+            page.draw(TFT)
+            Clock.current = start.replace(second=59)
+            page.draw(TFT)
+            Clock.current += timedelta(seconds=1)
+            # The next response is due
+            responses.current = following
+            store.expire()
+
+        results[name + "/refresh"] = measure(TFT, draw, iterations, prepare=before_refresh)
+    TFT.close()
+    return results
+
+
+def compare(results, baseline, traffic_tolerance, alloc_tolerance, time_tolerance):
+    failures = []
+    for stage, old in baseline.get("results", {}).items():
+        new = results.get(stage)
+        if new is None:
+            failures.append("{}: missing from this run".format(stage))
+            continue
+        for key in ("spi_bytes", "spi_transactions"):
+            if new[key] > old[key] * (1 + traffic_tolerance):
+                failures.append("{} {}: {} -> {}".format(stage, key, old[key], new[key]))
+        if new["peak_alloc_kb"] > old["peak_alloc_kb"] * (1 + alloc_tolerance) + ALLOC_ALLOWANCE_KB:
+            failures.append("{} peak_alloc_kb: {} -> {}".format(stage, old["peak_alloc_kb"], new["peak_alloc_kb"]))
+        for key in ("wall_ms", "cpu_ms"):
+            if new[key] > old[key] * (1 + time_tolerance) + TIME_ALLOWANCE_MS:
+                failures.append("{} {}: {} -> {}".format(stage, key, old[key], new[key]))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-page frame time and SPI traffic benchmark")
+    parser.add_argument("--iterations", type=int, default=15)
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="also write the results JSON to this file")
+    parser.add_argument("--traffic-tolerance", type=float, default=0.01)
+    parser.add_argument("--alloc-tolerance", type=float, default=0.1)
+    parser.add_argument("--time-tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    report = {"iterations": args.iterations, "results": run(args.iterations)}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+
+    if args.update_baseline:
+        Path(args.baseline).write_text(text + "\n")
+        print("Baseline written to", args.baseline)
+        return 0
+    try:
+        baseline = json.loads(Path(args.baseline).read_text())
+    except OSError:
+        print("No baseline at", args.baseline, "- run with --update-baseline to create one")
+        return 0
+    failures = check_clipping()
+    failures += compare(report["results"], baseline, args.traffic_tolerance, args.alloc_tolerance,
+                        args.time_tolerance)
+    for failure in failures:
+        print("REGRESSION:", failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# Local stand-in for the OpenWeatherMap onecall endpoint.
+#
+# Replays recorded responses (the two in fixtures/ by default) so the fetch, cache and
+# refresh paths can be exercised offline and repeatably. Point the app at it with the
+# OWM_BASE_URL environment variable:
+#
+#   python3 benchmarks/owm_server.py --port 8080 --latency 0.3 --error-rate 0.1
+#   OWM_BASE_URL=http://127.0.0.1:8080/data/2.5 DISPLAY_APP_BACKEND=virtual python3 infodisplay
+#
+# Each location gets the recorded responses in turn, one per request, staying on the last
+# one (or starting over with --loop). The "exclude" parameter is honoured, bodies are
+# gzipped when asked for, and an ETag is sent so conditional requests get a 304.
+# Faults can be injected:
+#   --latency/--jitter   seconds before the response
+#   --error-rate         fraction of requests answered 500
+#   --truncate-rate      fraction of bodies cut off halfway (the connection is then closed)
+#   --rate-limit         requests per minute before answering 429, as the API does
+# The faults are drawn from a random generator seeded with --seed, so a run repeats.
+#
+# With --record and an API key (--api-key or OWM_API_KEY) every request is passed on to the
+# real API and the response saved to --record-dir (default: recordings/) before it is
+# returned. Recordings are only replayed when named on the command line.
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlsplit
+from urllib.request import urlopen
+
+bench_path = Path(__file__).resolve().parent
+# Replayed in this order
+FIXTURES = [str(bench_path.joinpath("fixtures", name))
+            for name in ("onecall_derry.json", "onecall_derry_next.json")]
+RECORDINGS = bench_path.joinpath("recordings")
+ONECALL_PATH = "/data/2.5/onecall"
+UPSTREAM_URL = "https://api.openweathermap.org" + ONECALL_PATH
+
+
+class OWMStandIn:
+    """The stand-in server. start() serves from a background thread and returns the base URL."""
+
+    def __init__(self, fixtures=FIXTURES, host="127.0.0.1", port=0, loop=False,
+                 latency=0.0, jitter=0.0, error_rate=0.0, truncate_rate=0.0, rate_limit=None,
+                 seed=0, record=False, record_dir=None, api_key=None, upstream=UPSTREAM_URL):
+        self.responses = []
+        for path in fixtures:
+            with open(path) as f:
+                self.responses.append(json.load(f))
+        self.loop = loop
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.rate_limit = rate_limit
+        self.record = record
+        self.record_dir = Path(record_dir) if record_dir else RECORDINGS
+        self.api_key = api_key
+        self.upstream = upstream
+        # Outcome -> number of requests answered that way
+        self.stats = {}
+        self._random = random.Random(seed)
+        self._served = {}           # (lat, lon) -> responses served so far
+        self._recent = deque()      # time.monotonic() of the requests of the last minute
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}/data/2.5".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="owm-stand-in", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] = self.stats.get(outcome, 0) + 1
+
+    def plan(self):
+        """Draw the delay and the fault (None, "error", "truncate" or "rate_limit") of a request."""
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0] <= now - 60:
+                self._recent.popleft()
+            self._recent.append(now)
+            if self.rate_limit is not None and len(self._recent) > self.rate_limit:
+                fault = "rate_limit"
+            elif self._random.random() < self.error_rate:
+                fault = "error"
+            elif self._random.random() < self.truncate_rate:
+                fault = "truncate"
+            else:
+                fault = None
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        return delay, fault
+
+    def response_for(self, query):
+        """The onecall response for the query parameters (a dict of lists, as parse_qs gives)."""
+        lat = query.get("lat", ["0"])[0]
+        lon = query.get("lon", ["0"])[0]
+        if self.record:
+            weather = self._fetch_upstream(query)
+        else:
+            with self._lock:
+                served = self._served.get((lat, lon), 0)
+                self._served[(lat, lon)] = served + 1
+            if self.loop:
+                served %= len(self.responses)
+            weather = dict(self.responses[min(served, len(self.responses) - 1)])
+            weather["lat"], weather["lon"] = float(lat), float(lon)
+        excluded = query.get("exclude", [""])[0].split(",")
+        return {key: value for key, value in weather.items() if key not in excluded}
+
+    def _fetch_upstream(self, query):
+        params = {key: values[0] for key, values in query.items()}
+        params["appid"] = self.api_key
+        # Record everything; the exclusions are applied to the copy returned
+        params.pop("exclude", None)
+        with urlopen(self.upstream + "?" + urlencode(params), timeout=15) as response:
+            weather = json.load(response)
+        name = "onecall_{}_{}_{}.json".format(params.get("lat"), params.get("lon"), weather["current"]["dt"])
+        self.record_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.record_dir.joinpath(name), "w") as f:
+            json.dump(weather, f)
+        return weather
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        url = urlsplit(self.path)
+        if url.path != ONECALL_PATH:
+            stand_in._count("not_found")
+            self._send_json(404, {"cod": "404", "message": "Internal error"})
+            return
+
+        delay, fault = stand_in.plan()
+        if delay:
+            time.sleep(delay)
+        if fault == "rate_limit":
+            stand_in._count("rate_limited")
+            self._send_json(429, {"cod": 429, "message": "Your account is temporary blocked due to exceeding "
+                                  "of requests limitation of your subscription type."})
+            return
+        if fault == "error":
+            stand_in._count("error")
+            self._send_json(500, {"cod": "500", "message": "Internal error"})
+            return
+
+        try:
+            weather = stand_in.response_for(parse_qs(url.query))
+        except Exception as ex:
+            stand_in._count("upstream_error")
+            self._send_json(502, {"cod": "502", "message": str(ex)})
+            return
+        body = json.dumps(weather, separators=(",", ":")).encode("utf-8")
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get("If-None-Match") == etag and fault is None:
+            stand_in._count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        headers = {"Content-Type": "application/json; charset=utf-8", "ETag": etag}
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        if fault == "truncate":
+            stand_in._count("truncated")
+            self._send(200, headers, body, len(body) // 2)
+            self.close_connection = True
+            return
+        stand_in._count("ok")
+        self._send(200, headers, body)
+
+    def _send_json(self, status, message):
+        self._send(status, {"Content-Type": "application/json; charset=utf-8"},
+                   json.dumps(message).encode("utf-8"))
+
+    def _send(self, status, headers, body, length=None):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        # A truncated body still announces its full length
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:length])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenWeatherMap onecall endpoint")
+    parser.add_argument("fixtures", nargs="*", default=FIXTURES, help="recorded responses to replay, in order")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--loop", action="store_true", help="start the responses over after the last one")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, help="requests per minute before answering 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", action="store_true", help="pass requests on to the real API and save the responses")
+    parser.add_argument("--record-dir", help="where recorded responses go (default: recordings)")
+    parser.add_argument("--api-key", default=os.environ.get("OWM_API_KEY"))
+    args = parser.parse_args()
+    if args.record and not args.api_key:
+        parser.error("--record needs --api-key or OWM_API_KEY")
+
+    stand_in = OWMStandIn(args.fixtures, args.host, args.port, args.loop, args.latency, args.jitter,
+                          args.error_rate, args.truncate_rate, args.rate_limit, args.seed,
+                          args.record, args.record_dir, args.api_key)
+    print("Serving onecall on", stand_in.base_url)
+    try:
+        stand_in.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(stand_in.stats, sort_keys=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,9 @@ from datetime import datetime
 from time import mktime
 
 from .display import Display
-from .utils import get_weather_data
+from .icon_pack import icon_pack
+from .virtual_list import VirtualList
+from .weather_store import weather_store
 
 
 # Constants for TFT layout
@@ -13,6 +15,9 @@ ILI9341_TFTHEIGHT = 320
 ICON_HEIGHT = 50
 ICON_WIDTH = 50
 TOP_MARGIN = 5
+# Today is on the weather display, so this page starts with tomorrow
+FIRST_DAY = 1
+VISIBLE_ROWS = 6
 
 
 # Path to fonts
@@ -36,77 +41,84 @@ light_blue = (191, 253, 255)
 
 class DailyForecastDisplay(Display):
     
-    def __init__(self, lat=54.9981, lon=-7.3093) -> None:
+    def __init__(self, lat=54.9981, lon=-7.3093, store=None) -> None:
         self.lat = lat
         self.lon = lon
-        self.weather = get_weather_data(self.lat, self.lon, exclude="minutely,hourly")
+        self._store = weather_store(lat, lon) if store is None else store
+        self.forecast = self._store.forecast
         self.time = mktime(datetime.now().timetuple())
         self._has_drawn_display = False
+        # DailyRecords of the forecast, one per day, shown through a scrolling list
+        self._rows = []
+        self._list = VirtualList(self._print_daily_row, ICON_HEIGHT, VISIBLE_ROWS, first=FIRST_DAY)
 
-    def _print_daily_forecast(self, TFT, weather):
+    def _print_daily_forecast(self, TFT, forecast):
         try:
-            daily_data = []
-            daily_forecast = weather["daily"]
-            daily_forecast_len = len(daily_forecast)
-
-            if (daily_forecast_len >= 7 and self.weather is not None):
-                for i in range(1, 7):
-                    weekday = datetime.utcfromtimestamp(daily_forecast[i]["dt"]).strftime("%a")
-                    date = datetime.utcfromtimestamp(daily_forecast[i]["dt"]).strftime("%d/%m")
-                    temp = f"{daily_forecast[i]['temp']['max']:.1f}/{daily_forecast[i]['temp']['min']:.1f}\u00b0C"
-                    humidity = f"{daily_forecast[i]['humidity']:4.1f}%"
-                    icon_id = daily_forecast[i]["weather"][0]["icon"]
-                    condition = daily_forecast[i]["weather"][0]["main"]
-
-                    daily_data.append({"weekday": weekday,"date": date, "temp": temp, "humidity": humidity, "icon_id": icon_id, "condition": condition})
-
-                for i in range(0, 6):
-                    # Create block for printing day and date, width = 10px more than date text, height same as icon
-                    block_a = Image.new('RGB', (DATE_BOX_SIZE[0]+10, ICON_HEIGHT), black)
-                    draw_a = ImageDraw.Draw(block_a)
-                    day_string_width, day_string_height = draw_a.textsize(daily_data[i]["weekday"], fnt_large)
-                    date_string_width, date_string_height = draw_a.textsize(daily_data[i]["date"], fnt_large)
-                    draw_a.text(( ((block_a.size[0] - day_string_width) / 2), 10 ), daily_data[i]["weekday"], fill=white, font=fnt_large)
-                    draw_a.text(( ((block_a.size[0] - date_string_width) / 2), (block_a.size[1] - date_string_height - 10) ), daily_data[i]["date"], fill=white, font=fnt_large)
-                    TFT.display_block(block_a, 0, block_a.size[1]*i, block_a.size[0]-1, block_a.size[1]*(i+1)-1) 
-
-                    # Print weather icon
-                    with Image.open(Path(__file__).resolve().parents[1].joinpath("resources/SmallIcons/" + daily_data[i]["icon_id"] + ".bmp")) as icon:
-                        TFT.display_block(icon, block_a.size[0], 50*i, block_a.size[0]+50-1, 50*(i+1)-1)
-
-                    # Create block for description, temperature and humidity
-                    block_b = Image.new('RGB', ( (ILI9341_TFTWIDTH - ICON_WIDTH - block_a.size[0]), ICON_HEIGHT ), black)
-                    draw_b = ImageDraw.Draw(block_b)
-                    condition_string_width, condition_string_height = draw_b.textsize(daily_data[i]["condition"], fnt_large)
-                    temp_string_width, temp_string_height = draw_b.textsize(daily_data[i]["temp"], fnt_large)
-                    humidity_string_width, humidity_string_height = draw_b.textsize(daily_data[i]["humidity"], fnt_large)
-
-                    draw_b.text((5, 10), daily_data[i]["condition"], fill=yellow, font=fnt_large)
-                    draw_b.text((5, (block_b.size[1] - temp_string_height - 10)), daily_data[i]["temp"], fill=white, font=fnt_large)
-                    draw_b.text(((block_b.size[0] - humidity_string_width - 5), (block_b.size[1] - humidity_string_height - 10)), daily_data[i]["humidity"], fill=light_blue, font=fnt_large)
-
-                    block_b_x0 = block_a.size[0] + ICON_WIDTH
-                    TFT.display_block(block_b, block_b_x0, block_b.size[1]*i, block_b_x0+block_b.size[0]-1, block_b.size[1]*(i+1)-1)               
+            daily_forecast = forecast.daily
+
+            if (len(daily_forecast) >= 7):
+                # One preformatted record per day; the list renders the visible ones
+                self._rows = daily_forecast
+                self._list.count = len(daily_forecast)
+                self._list.draw(TFT)
         except Exception as ex:
             print(ex)
 
+    def _print_daily_row(self, TFT, index, y0):
+        row = self._rows[index]
+        # Create block for printing day and date, width = 10px more than date text, height same as icon
+        block_a = Image.new('RGB', (DATE_BOX_SIZE[0]+10, ICON_HEIGHT), black)
+        draw_a = ImageDraw.Draw(block_a)
+        day_string_width, day_string_height = draw_a.textsize(row.weekday, fnt_large)
+        date_string_width, date_string_height = draw_a.textsize(row.date, fnt_large)
+        draw_a.text(( ((block_a.size[0] - day_string_width) / 2), 10 ), row.weekday, fill=white, font=fnt_large)
+        draw_a.text(( ((block_a.size[0] - date_string_width) / 2), (block_a.size[1] - date_string_height - 10) ), row.date, fill=white, font=fnt_large)
+        TFT.display_block(block_a, 0, y0, block_a.size[0]-1, y0+block_a.size[1]-1)
+
+        # Print weather icon
+        icon_pack().blit(TFT, "SmallIcons", row.icon_id, block_a.size[0], y0)
+
+        # Create block for description, temperature and humidity
+        block_b = Image.new('RGB', ( (ILI9341_TFTWIDTH - ICON_WIDTH - block_a.size[0]), ICON_HEIGHT ), black)
+        draw_b = ImageDraw.Draw(block_b)
+        condition_string_width, condition_string_height = draw_b.textsize(row.condition, fnt_large)
+        temp_string_width, temp_string_height = draw_b.textsize(row.temp, fnt_large)
+        humidity_string_width, humidity_string_height = draw_b.textsize(row.humidity, fnt_large)
+
+        draw_b.text((5, 10), row.condition, fill=yellow, font=fnt_large)
+        draw_b.text((5, (block_b.size[1] - temp_string_height - 10)), row.temp, fill=white, font=fnt_large)
+        draw_b.text(((block_b.size[0] - humidity_string_width - 5), (block_b.size[1] - humidity_string_height - 10)), row.humidity, fill=light_blue, font=fnt_large)
+
+        block_b_x0 = block_a.size[0] + ICON_WIDTH
+        TFT.display_block(block_b, block_b_x0, y0, block_b_x0+block_b.size[0]-1, y0+block_b.size[1]-1)
+
     def _print_forecast(self, TFT, force=False):
-        # Update daily forecast screen every 2 minutes
-        # The 'force' flag bypasses the time check
-        now = datetime.now()
-
-        if (now.second == 0 and now.minute % 2 == 0) or force is True:
-            try:
-                # Compare time with weather object timestamp and only update if weather object is more than 120 seconds old
-                weather_timestamp = datetime.utcfromtimestamp(self.weather["current"]["dt"])
-                tdiff = now - weather_timestamp
-                if tdiff.seconds >= 120:
-                    self.weather = get_weather_data(self.lat, self.lon, exclude="minutely,hourly")
-                if self.weather is not None:
+        # Update the daily forecast screen whenever the store has a new forecast
+        # The 'force' flag redraws it anyway
+        try:
+            forecast = self._store.get()
+            if forecast is not None and (forecast is not self.forecast or force is True):
+                self.forecast = forecast
+                # Compose the page and send only the rows that changed
+                TFT.begin_frame()
+                try:
                     TFT.clear()
-                    self._print_daily_forecast(TFT, self.weather)
-            except Exception as ex:
-                print(ex)
+                    self._print_daily_forecast(TFT, self.forecast)
+                finally:
+                    TFT.present()
+                self._list.apply(TFT)
+        except Exception as ex:
+            print(ex)
+
+    def scroll(self, TFT, rows):
+        # Only the newly exposed rows are rendered and sent
+        try:
+            self._list.scroll(TFT, rows)
+        except Exception as ex:
+            print("An exception ocurred while scrolling the daily forecast", ex)
+
+    def release(self, TFT):
+        self._list.release(TFT)
 
     def draw(self, TFT):
         now = mktime(datetime.now().timetuple())
@@ -115,6 +127,7 @@ class DailyForecastDisplay(Display):
         # another display has been drawn
         if (now - self.time > 2) or not self._has_drawn_display:
             self.time = now
+            self._list.first = FIRST_DAY
             self._print_forecast(TFT, force=True)
             self._has_drawn_display = True
         else:
@@ -2,3 +2,15 @@ class Display:
 
     def draw(self, TFT):
         pass
+
+    def invalidate(self):
+        # Force a complete redraw the next time the display is drawn
+        self._has_drawn_display = False
+
+    def scroll(self, TFT, rows):
+        # Displays with more content than fits on the screen scroll by "rows"
+        pass
+
+    def release(self, TFT):
+        # Called when another display takes over the TFT
+        pass
@@ -0,0 +1,126 @@
+# Forecast model built once per onecall response.
+# The numeric hourly and daily series are kept as NumPy columns, and every entry
+# the pages show has a __slots__ record with its strings already formatted, so
+# drawing is only attribute lookups. The raw JSON is not kept.
+
+from datetime import datetime
+
+import numpy as np
+
+
+class CurrentRecord:
+    __slots__ = ("dt", "description", "icon_id", "temp", "humidity", "wind_speed")
+
+    def __init__(self, entry):
+        self.dt = entry["dt"]
+        self.description = entry["weather"][0]["main"].title()
+        self.icon_id = entry["weather"][0]["icon"]
+        self.temp = f"{entry['temp']:<4.1f}\u00b0C"
+        self.humidity = f"{entry['humidity']:<4.1f}%"
+        self.wind_speed = f"{entry['wind_speed']:<4.2f} m/s"
+
+
+class HourlyRecord:
+    __slots__ = ("time", "temp", "humidity", "condition", "icon_id")
+
+    def __init__(self, entry):
+        self.time = datetime.utcfromtimestamp(entry["dt"]).strftime("%H:%M")
+        self.temp = f"{entry['temp']:>4.1f}\u00b0C"
+        self.humidity = f"{entry['humidity']:4.1f}%"
+        self.condition = entry["weather"][0]["main"]
+        self.icon_id = entry["weather"][0]["icon"]
+
+
+class DailyRecord:
+    __slots__ = ("weekday", "date", "temp", "humidity", "condition", "icon_id")
+
+    def __init__(self, entry):
+        day = datetime.utcfromtimestamp(entry["dt"])
+        self.weekday = day.strftime("%a")
+        self.date = day.strftime("%d/%m")
+        self.temp = f"{entry['temp']['max']:.1f}/{entry['temp']['min']:.1f}\u00b0C"
+        self.humidity = f"{entry['humidity']:4.1f}%"
+        self.condition = entry["weather"][0]["main"]
+        self.icon_id = entry["weather"][0]["icon"]
+
+
+class Forecast:
+    """One onecall response: current conditions, hourly and daily series.
+
+    A response without some of the datasets (left out with "exclude") takes them from
+    previous, the Forecast it updates.
+    """
+
+    __slots__ = ("current", "hourly", "daily",
+                 "hourly_dt", "hourly_temp", "hourly_humidity",
+                 "daily_dt", "daily_temp_min", "daily_temp_max", "daily_humidity")
+
+    def __init__(self, weather, previous=None):
+        # Raises KeyError/TypeError/IndexError for a response that is not a onecall response
+        if "current" in weather:
+            self.current = CurrentRecord(weather["current"])
+        else:
+            self.current = None if previous is None else previous.current
+
+        if "hourly" in weather:
+            hourly = weather["hourly"]
+            self.hourly = [HourlyRecord(entry) for entry in hourly]
+            self.hourly_dt = np.array([entry["dt"] for entry in hourly], dtype=np.int64)
+            self.hourly_temp = np.array([entry["temp"] for entry in hourly], dtype=np.float32)
+            self.hourly_humidity = np.array([entry["humidity"] for entry in hourly], dtype=np.float32)
+        else:
+            source = _EMPTY if previous is None else previous
+            self.hourly = source.hourly
+            self.hourly_dt = source.hourly_dt
+            self.hourly_temp = source.hourly_temp
+            self.hourly_humidity = source.hourly_humidity
+
+        if "daily" in weather:
+            daily = weather["daily"]
+            self.daily = [DailyRecord(entry) for entry in daily]
+            self.daily_dt = np.array([entry["dt"] for entry in daily], dtype=np.int64)
+            self.daily_temp_min = np.array([entry["temp"]["min"] for entry in daily], dtype=np.float32)
+            self.daily_temp_max = np.array([entry["temp"]["max"] for entry in daily], dtype=np.float32)
+            self.daily_humidity = np.array([entry["humidity"] for entry in daily], dtype=np.float32)
+        else:
+            source = _EMPTY if previous is None else previous
+            self.daily = source.daily
+            self.daily_dt = source.daily_dt
+            self.daily_temp_min = source.daily_temp_min
+            self.daily_temp_max = source.daily_temp_max
+            self.daily_humidity = source.daily_humidity
+
+    @property
+    def dt(self):
+        # Time of the current conditions, seconds since the epoch
+        return self.current.dt
+
+    def changes(self, previous):
+        """The datasets ("current", "hourly", "daily") that differ from those of previous."""
+        if previous is None:
+            return {"current", "hourly", "daily"}
+        changed = set()
+        if _values(self.current) != _values(previous.current):
+            changed.add("current")
+        if not (np.array_equal(self.hourly_dt, previous.hourly_dt)
+                and np.array_equal(self.hourly_temp, previous.hourly_temp)
+                and np.array_equal(self.hourly_humidity, previous.hourly_humidity)
+                and [hour.icon_id for hour in self.hourly] == [hour.icon_id for hour in previous.hourly]):
+            changed.add("hourly")
+        if not (np.array_equal(self.daily_dt, previous.daily_dt)
+                and np.array_equal(self.daily_temp_min, previous.daily_temp_min)
+                and np.array_equal(self.daily_temp_max, previous.daily_temp_max)
+                and np.array_equal(self.daily_humidity, previous.daily_humidity)
+                and [day.icon_id for day in self.daily] == [day.icon_id for day in previous.daily]):
+            changed.add("daily")
+        return changed
+
+
+def _values(record):
+    if record is None:
+        return None
+    return tuple(getattr(record, name) for name in record.__slots__)
+
+
+# Where the series come from when neither the response nor a previous Forecast has them
+_EMPTY = Forecast({"hourly": [], "daily": []})
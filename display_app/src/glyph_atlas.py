@@ -0,0 +1,143 @@
+# Text rendering from pre-rasterised glyphs.
+# Each font/size is rasterised once per (background, foreground) colour pair into
+# 565 RGB tiles, one per character, already blended over the background colour.
+# A string is then drawn by copying tiles side by side into a reusable box array (one per
+# thread, as the panels of different buses are drawn at the same time),
+# with no PIL image or FreeType call per update, which matters for the fields that
+# change all the time (clock, temperatures, humidity). Glyphs are placed on their
+# advance width, as PIL's basic layout does for the FreeSans text on the pages.
+
+import threading
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+
+from .lib_tft24T import color565, rgb_to_565
+
+# Characters rasterised up front; anything else gets a tile on first use
+NUMERIC_CHARSET = "0123456789:.,-+ %°Cm/s"
+
+
+def _rgb(color):
+    if isinstance(color, str):
+        return ImageColor.getrgb(color)[:3]
+    return tuple(color[:3])
+
+
+class GlyphAtlas:
+    """565 RGB glyph tiles of one font in one foreground/background colour pair."""
+
+    def __init__(self, font, fill_color='black', font_color='white', charset=NUMERIC_CHARSET):
+        self._font = font
+        self.fill_color = _rgb(fill_color)
+        self._font_color = _rgb(font_color)
+        self._fill_value = color565(self.fill_color)
+        ascent, descent = font.getmetrics()
+        self.height = ascent + descent
+        self._tiles = {}
+        # Output arrays of each thread, one per box size; the TFT copies them into its frame straight away
+        self._local = threading.local()
+        for char in charset:
+            self.tile(char)
+
+    def tile(self, char):
+        """The (height, advance width) 565 tile of a character, rasterised on first use."""
+        tile = self._tiles.get(char)
+        if tile is None:
+            width = max(int(round(self._font.getlength(char))), 1)
+            image = Image.new('RGB', (width, self.height), self.fill_color)
+            ImageDraw.Draw(image).text((0, 0), char, font=self._font, fill=self._font_color)
+            tile = rgb_to_565(np.asarray(image))
+            self._tiles[char] = tile
+        return tile
+
+    def render(self, text, boxsize):
+        """Return text drawn at the top left of a (width, height) box, as wire order 565 pixels.
+
+        The array is reused for every render into a box of the same size on the same thread.
+        """
+        width, height = boxsize
+        boxes = getattr(self._local, "boxes", None)
+        if boxes is None:
+            boxes = self._local.boxes = {}
+        box = boxes.get((width, height))
+        if box is None:
+            box = np.empty((height, width), dtype=np.uint16)
+            boxes[(width, height)] = box
+        box.fill(self._fill_value)
+        rows = min(self.height, height)
+        x = 0
+        for char in text:
+            if x >= width:
+                break
+            tile = self.tile(char)
+            columns = min(tile.shape[1], width - x)
+            box[:rows, x:x+columns] = tile[:rows, :columns]
+            x += tile.shape[1]
+        return box
+
+    def draw(self, TFT, text, boxsize, x0, y0):
+        """Draw text in a box of boxsize with its top left corner at x0, y0."""
+        TFT.display_pixels(self.render(text, boxsize), x0, y0)
+
+
+class TextField:
+    """A text box at a fixed place that only redraws the character cells that changed."""
+
+    def __init__(self, atlas, boxsize, x0, y0):
+        self._atlas = atlas
+        self._boxsize = boxsize
+        self._x0 = x0
+        self._y0 = y0
+        self._cells = None      # (char, x, width) of each character on the panel
+
+    def invalidate(self):
+        """Forget what is shown, e.g. after the screen was cleared. The next draw is complete."""
+        self._cells = None
+
+    def _layout(self, text):
+        cells = []
+        x = 0
+        for char in text:
+            width = self._atlas.tile(char).shape[1]
+            cells.append((char, x, width))
+            x += width
+        return cells
+
+    def draw(self, TFT, text):
+        if self._cells is None:
+            self._atlas.draw(TFT, text, self._boxsize, self._x0, self._y0)
+            self._cells = self._layout(text)
+            return
+        width, height = self._boxsize
+        rows = min(self._atlas.height, height)
+        cells = self._layout(text)
+        for i, cell in enumerate(cells):
+            if i < len(self._cells) and self._cells[i] == cell:
+                continue
+            char, x, columns = cell
+            columns = min(columns, width - x)
+            if columns <= 0:
+                break
+            TFT.display_pixels(self._atlas.tile(char)[:rows, :columns], self._x0 + x, self._y0)
+        # Blank whatever the previous, longer text covered beyond the new one
+        end = min(cells[-1][1] + cells[-1][2] if cells else 0, width)
+        old_end = min(self._cells[-1][1] + self._cells[-1][2] if self._cells else 0, width)
+        if old_end > end:
+            TFT.fill_rect(self._x0 + end, self._y0, self._x0 + old_end - 1, self._y0 + rows - 1,
+                          self._atlas.fill_color)
+        self._cells = cells
+
+
+_atlases = {}
+_atlases_lock = threading.Lock()
+
+def glyph_atlas(font, fill_color='black', font_color='white'):
+    """Return the shared atlas for a FreeType font and colour pair, building it on first use."""
+    key = (font.path, font.size, _rgb(fill_color), _rgb(font_color))
+    with _atlases_lock:
+        atlas = _atlases.get(key)
+        if atlas is None:
+            atlas = GlyphAtlas(font, fill_color, font_color)
+            _atlases[key] = atlas
+        return atlas
@@ -0,0 +1,46 @@
+# Hardware abstraction layer: where the SPI, GPIO and I2C/BME280 modules come from.
+# The default "hardware" backend imports spidev, RPi.GPIO, smbus2 and bme280.
+# The "virtual" backend uses the simulated board in virtual_hw, so the whole display
+# stack runs (and can be measured) on any Linux box:
+#   DISPLAY_APP_BACKEND=virtual python3 -m ...
+# or call use_backend("virtual") before the rest of the application is imported.
+
+import os
+from types import SimpleNamespace
+
+_backend = None
+
+
+def _hardware_backend():
+    import spidev
+    import RPi.GPIO as GPIO
+    import smbus2
+    import bme280
+    return SimpleNamespace(name="hardware", spidev=spidev, GPIO=GPIO, smbus2=smbus2, bme280=bme280, board=None)
+
+
+def _virtual_backend(board=None):
+    from .virtual_hw import VirtualHardware
+    if board is None:
+        board = VirtualHardware()
+    return SimpleNamespace(name="virtual", spidev=board.spidev, GPIO=board.gpio,
+                           smbus2=board.smbus2, bme280=board.bme280, board=board)
+
+
+def use_backend(name, board=None):
+    """Select the backend by name ("hardware" or "virtual"). A VirtualHardware can be passed in."""
+    global _backend
+    if name == "virtual":
+        _backend = _virtual_backend(board)
+    elif name == "hardware":
+        _backend = _hardware_backend()
+    else:
+        raise ValueError("Unknown backend: " + name)
+    return _backend
+
+
+def backend():
+    """The active backend, chosen from DISPLAY_APP_BACKEND on first use."""
+    if _backend is None:
+        use_backend(os.environ.get("DISPLAY_APP_BACKEND", "hardware"))
+    return _backend
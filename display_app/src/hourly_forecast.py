@@ -4,7 +4,10 @@ from datetime import datetime
 from time import mktime
 
 from .display import Display
-from .utils import get_weather_data
+from .icon_pack import icon_pack
+from .glyph_atlas import glyph_atlas
+from .virtual_list import VirtualList
+from .weather_store import weather_store
 
 
 # Constants for TFT layout
@@ -13,6 +16,9 @@ ILI9341_TFTHEIGHT = 320
 ICON_HEIGHT = 50
 ICON_WIDTH = 50
 TOP_MARGIN = 5
+# Hours 1-3 are on the weather display, so this page starts at hour 4
+FIRST_HOUR = 4
+VISIBLE_ROWS = 6
 
 # Path to fonts
 fonts_path = Path(__file__).resolve().parents[1].joinpath("resources/fonts/")
@@ -266,111 +272,103 @@ light_blue = (191, 253, 255)
 
 class HourlyForecastDisplay(Display):
 
-    def __init__(self, lat=54.9981, lon=-7.3093) -> None:
+    def __init__(self, lat=54.9981, lon=-7.3093, store=None) -> None:
         self.lat = lat
         self.lon = lon
-        self.weather = get_weather_data(self.lat, self.lon)
+        self._store = weather_store(lat, lon) if store is None else store
+        self.forecast = self._store.forecast
         # Get timestamp in seconds 
         self.time = mktime(datetime.now().timetuple())
         self._has_drawn_display = False
+        # HourlyRecords of the forecast, one per hour, shown through a scrolling list
+        self._rows = []
+        self._list = VirtualList(self._print_hourly_row, ICON_HEIGHT, VISIBLE_ROWS, first=FIRST_HOUR)
 
     def _tft_print_blocktext(self, TFT, text, font, boxsize, coordinates, fill_color='black', font_color='white'):
-        bounding_box = Image.new('RGB', boxsize, fill_color)
-        draw = ImageDraw.Draw(bounding_box)
-        draw.text((0,0), text, font=font, fill=font_color)
-        TFT.display_block(bounding_box, coordinates[0], coordinates[1], coordinates[2]-1, coordinates[3]-1)
+        # Composed from cached glyph tiles; no PIL image is rendered per update
+        glyph_atlas(font, fill_color, font_color).draw(TFT, text, boxsize, coordinates[0], coordinates[1])
 
     def _print_forecast(self, TFT, force=False):
-        # Update hourly forecast screen every 2 minutes
-        # The 'force' flag bypasses the time check
-        now = datetime.now()
-
-        if (now.second == 0 and now.minute % 2 == 0) or force is True:
-            try:
-                # Compare time with weather object timestamp and only update if weather object is more than 120 seconds old
-                weather_timestamp = datetime.utcfromtimestamp(self.weather["current"]["dt"])
-                tdiff = now - weather_timestamp
-                if tdiff.seconds >= 120:
-                    self.weather = get_weather_data(self.lat, self.lon)
-                if self.weather is not None:
+        # Update the hourly forecast screen whenever the store has a new forecast
+        # The 'force' flag redraws it anyway
+        try:
+            forecast = self._store.get()
+            if forecast is not None and (forecast is not self.forecast or force is True):
+                self.forecast = forecast
+                # Compose the page and send only the rows that changed
+                TFT.begin_frame()
+                try:
                     TFT.clear()
-                    self._print_hourly_forecast_v2(TFT, self.weather)
-            except Exception as ex:
-                print(ex)
+                    self._print_hourly_forecast_v2(TFT, self.forecast)
+                finally:
+                    TFT.present()
+                self._list.apply(TFT)
+        except Exception as ex:
+            print(ex)
+
+    def scroll(self, TFT, rows):
+        # Only the newly exposed rows are rendered and sent
+        try:
+            self._list.scroll(TFT, rows)
+        except Exception as ex:
+            print("An exception ocurred while scrolling the hourly forecast", ex)
 
-    def _print_hourly_forecast(self, TFT, weather):
+    def release(self, TFT):
+        self._list.release(TFT)
+
+    def _print_hourly_forecast(self, TFT, forecast):
         try:
             # Get hourly forecast
-            hourly_data = []
-            hourly_forecast = weather["hourly"]
-            hourly_forecast_len = len(hourly_forecast)
+            hourly_forecast = forecast.hourly
 
              # Need forecast for 9 hours. Normally the API responds with a 48-hours forecast.
-            if (hourly_forecast_len >= 10):
-             # Create strings with the values and populate a list
-                for i in range(1, 10):
-                    time = datetime.utcfromtimestamp(hourly_forecast[i]["dt"]).strftime("%H:%M")
-                    temp = f"{hourly_forecast[i]['temp']:>4.1f}\u00b0C"
-                    humidity = f"{hourly_forecast[i]['humidity']:4.1f}%"
-                    icon_id = hourly_forecast[i]["weather"][0]["icon"]
-
-                    hourly_data.append({"time": time, "temp": temp, "humidity": humidity, "icon_id": icon_id})
-                    
-                # Iterate over the list and print values on the LCD
+            if (len(hourly_forecast) >= 10):
+                # Print the preformatted strings of hours 1-9 on the LCD
                 for i in range(0, 9):
-                    self._tft_print_blocktext(TFT, hourly_data[i]["time"], fnt_small, HOURLY_TIME_BOX_SIZE, time_coords[i])
-                    self._tft_print_blocktext(TFT, hourly_data[i]["temp"], fnt_small, HOURLY_TEMP_BOX_SIZE, temp_coords[i])
-                    self._tft_print_blocktext(TFT, hourly_data[i]["humidity"], fnt_small, HOURLY_HUMIDITY_BOX_SIZE, humidity_coords[i])
+                    hour = hourly_forecast[i + 1]
+                    self._tft_print_blocktext(TFT, hour.time, fnt_small, HOURLY_TIME_BOX_SIZE, time_coords[i])
+                    self._tft_print_blocktext(TFT, hour.temp, fnt_small, HOURLY_TEMP_BOX_SIZE, temp_coords[i])
+                    self._tft_print_blocktext(TFT, hour.humidity, fnt_small, HOURLY_HUMIDITY_BOX_SIZE, humidity_coords[i])
 
-                    with Image.open(Path(__file__).resolve().parents[1].joinpath("resources/SmallIcons/" + hourly_data[i]["icon_id"] + ".bmp")) as icon:
-                        TFT.display_block(icon, (*icon_coords[i]))
+                    icon_pack().blit(TFT, "SmallIcons", hour.icon_id, icon_coords[i][0], icon_coords[i][1])
 
         except Exception as ex:
             print("An exception ocurred while parsing/displaying weather", ex)
 
-    def _print_hourly_forecast_v2(self, TFT, weather):
+    def _print_hourly_forecast_v2(self, TFT, forecast):
         try:
             # Get hourly forecast
-            hourly_data = []
-            hourly_forecast = weather["hourly"]
-            hourly_forecast_len = len(hourly_forecast)
+            hourly_forecast = forecast.hourly
 
              # Need forecast for 6 hours. Normally the API responds with a 48-hours forecast.
-            if (hourly_forecast_len >= 13):
-             # Create strings with the values and populate a list
-                for i in range(4, 11):
-                    time = datetime.utcfromtimestamp(hourly_forecast[i]["dt"]).strftime("%H:%M")
-                    temp = f"{hourly_forecast[i]['temp']:>4.1f}\u00b0C"
-                    humidity = f"{hourly_forecast[i]['humidity']:4.1f}%"
-                    condition = hourly_forecast[i]["weather"][0]["main"]
-                    icon_id = hourly_forecast[i]["weather"][0]["icon"]
-
-                    hourly_data.append({"time": time, "temp": temp, "humidity": humidity, "condition": condition, "icon_id": icon_id})
-                    
-                # Iterate over the list and print values on the LCD
-                for i in range(0, 6):
-                    # Create a black box, get its draw object
-                    background = Image.new('RGB', (ILI9341_TFTWIDTH - ICON_WIDTH, ICON_HEIGHT), black)
-                    draw = ImageDraw.Draw(background)
-
-                    time_string_width, time_string_height = draw.textsize(hourly_data[i]["time"], fnt_large)
-                    temp_string_width, temp_string_height = draw.textsize(hourly_data[i]["temp"], fnt_large)
-                    humidity_string_width, humidity_string_height = draw.textsize(hourly_data[i]["humidity"], fnt_large)
-                    condition_string_width, condition_string_height = draw.textsize(hourly_data[i]["condition"], fnt_large)
-
-                    draw.text((10, 10), hourly_data[i]["time"], color=black, font=fnt_large)
-                    draw.text((10, ICON_HEIGHT-condition_string_height-10), hourly_data[i]["condition"], color=black, font=fnt_large)
-                    draw.text(( ILI9341_TFTWIDTH - ICON_WIDTH - temp_string_width, 10 ), hourly_data[i]["temp"], font=fnt_large )
-                    draw.text(( ILI9341_TFTWIDTH - ICON_WIDTH - humidity_string_width, ICON_HEIGHT - humidity_string_height -10 ), hourly_data[i]["humidity"], font=fnt_large, fill=light_blue )
-
-                    TFT.display_block(background, 50, 50*i, ILI9341_TFTWIDTH-1, 50*(i+1)-1)
-
-                    with Image.open(Path(__file__).resolve().parents[1].joinpath("resources/SmallIcons/" + hourly_data[i]["icon_id"] + ".bmp")) as icon:
-                        TFT.display_block(icon, 0, 50*i, 50-1, 50*(i+1)-1)
+            if (len(hourly_forecast) >= 13):
+                # One preformatted record per hour; the list renders the visible ones
+                self._rows = hourly_forecast
+                self._list.count = len(hourly_forecast)
+                self._list.draw(TFT)
 
         except Exception as ex:
             print("An exception ocurred while parsing/displaying weather", ex)
 
+    def _print_hourly_row(self, TFT, index, y0):
+        row = self._rows[index]
+        # Create a black box, get its draw object
+        background = Image.new('RGB', (ILI9341_TFTWIDTH - ICON_WIDTH, ICON_HEIGHT), black)
+        draw = ImageDraw.Draw(background)
+
+        time_string_width, time_string_height = draw.textsize(row.time, fnt_large)
+        temp_string_width, temp_string_height = draw.textsize(row.temp, fnt_large)
+        humidity_string_width, humidity_string_height = draw.textsize(row.humidity, fnt_large)
+        condition_string_width, condition_string_height = draw.textsize(row.condition, fnt_large)
+
+        draw.text((10, 10), row.time, color=black, font=fnt_large)
+        draw.text((10, ICON_HEIGHT-condition_string_height-10), row.condition, color=black, font=fnt_large)
+        draw.text(( ILI9341_TFTWIDTH - ICON_WIDTH - temp_string_width, 10 ), row.temp, font=fnt_large )
+        draw.text(( ILI9341_TFTWIDTH - ICON_WIDTH - humidity_string_width, ICON_HEIGHT - humidity_string_height -10 ), row.humidity, font=fnt_large, fill=light_blue )
+
+        TFT.display_block(background, 50, y0, ILI9341_TFTWIDTH-1, y0+ICON_HEIGHT-1)
+        icon_pack().blit(TFT, "SmallIcons", row.icon_id, 0, y0)
+
     def draw(self, TFT):
         now = mktime(datetime.now().timetuple())
 
@@ -378,6 +376,7 @@ class HourlyForecastDisplay(Display):
         # another display has been drawn
         if (now - self.time > 2) or not self._has_drawn_display:
             self.time = now
+            self._list.first = FIRST_HOUR
             self._print_forecast(TFT, force=True)
             self._has_drawn_display = True
         else:
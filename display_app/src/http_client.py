@@ -0,0 +1,228 @@
+# Keep-alive HTTP client for the weather API.
+# One requests.Session with a small connection pool is shared by every request, so
+# after the first one there is no new DNS lookup, TCP connect or TLS handshake while
+# the server keeps the connection open. Responses are asked for gzip compressed, and
+# the ETag / Last-Modified validators of the last response to each URL can be sent
+# back, so unchanged data comes back as an empty 304. Only the validators are kept, not
+# the body: the caller still has the data a 304 refers to.
+#
+# Each request is timed: DNS, TCP connect and TLS (zero when a pooled connection was
+# reused), waiting for the response headers and reading the body. The last
+# TIMING_HISTORY timings are kept in HTTPClient.timings, with the API key blanked out
+# of their URLs.
+#
+# Requests run from several threads at once (one per location being refreshed), but
+# never more than MAX_PER_HOST to the same host: the rest wait for a slot, so every
+# request has a pooled connection to use and no extra ones are opened and thrown away.
+
+import re
+import socket
+import threading
+import time
+from collections import deque, namedtuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError
+
+# (connect, read) seconds
+HTTP_TIMEOUT = (5, 15)
+# Connections kept open per host, enough for one request per location at a time
+POOL_SIZE = 10
+MAX_PER_HOST = POOL_SIZE
+TIMING_HISTORY = 50
+# Query parameters that are never kept in a timing's url or printed
+SECRET_PARAMS = re.compile(r"([?&]appid=)[^&\s]*")
+
+# status is the HTTP status, None if the request was sent but no answer came back;
+# data is the parsed body of a 200, None for any other status or a body that was cut off
+JSONResponse = namedtuple("JSONResponse", "status data")
+
+# Times in seconds; wire_bytes is the (compressed) body as received, body_bytes after decoding
+RequestTiming = namedtuple("RequestTiming",
+                           "url status reused dns connect tls wait transfer total wire_bytes body_bytes")
+
+
+def redact(text):
+    """text (a URL, or a message with URLs in it) with the API key replaced by ***."""
+    return SECRET_PARAMS.sub(r"\1***", text)
+
+
+# Connection set-up times of the request running on this thread
+_setup = threading.local()
+
+
+def _reset_setup():
+    _setup.dns = _setup.connect = _setup.tls = 0.0
+    _setup.reused = True
+    _setup.connected = False
+
+
+class _TimedConnectionMixin:
+    # Resolves the host itself, so name lookup and TCP connect are timed separately
+
+    def _new_conn(self):
+        _setup.reused = False
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        resolved = time.perf_counter()
+        _setup.dns = resolved - start
+        dns_host = self._dns_host
+        error = None
+        try:
+            # Connect to the resolved addresses in turn, as create_connection would
+            for address in addresses:
+                self._dns_host = address[4][0]
+                try:
+                    sock = super()._new_conn()
+                    break
+                except Exception as e:
+                    error = e
+            else:
+                raise error
+        finally:
+            self._dns_host = dns_host
+        _setup.connect = time.perf_counter() - resolved
+        return sock
+
+    def connect(self):
+        super().connect()
+        # From here on the request reaches the server
+        _setup.connected = True
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        # Whatever connect() spent beyond name lookup and TCP connect is the handshake
+        _setup.tls = max(time.perf_counter() - start - _setup.dns - _setup.connect, 0.0)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool,
+                                                   "https": TimedHTTPSConnectionPool}
+
+
+class HTTPClient:
+
+    def __init__(self, timeout=HTTP_TIMEOUT, pool_size=POOL_SIZE, max_per_host=MAX_PER_HOST):
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        # host -> BoundedSemaphore with a slot per request allowed at the same time
+        self._host_slots = {}
+        self.session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip"
+        # url -> (ETag, Last-Modified) of the last 200 response
+        self._validators = {}
+        self._lock = threading.Lock()
+        self.timings = deque(maxlen=TIMING_HISTORY)
+
+    @property
+    def last_timing(self):
+        return self.timings[-1] if self.timings else None
+
+    def get_json(self, url, conditional=False):
+        """GET url and return a JSONResponse.
+
+        conditional: send the validators of the last 200 response for the url, so the
+        answer is a 304 (with no data) if it has not changed since.
+        Errors before the request could be sent (name lookup, connect, TLS handshake)
+        raise requests exceptions; once it was sent, a JSONResponse is always returned.
+        """
+        with self._lock:
+            etag, last_modified = self._validators.get(url, (None, None))
+        headers = {}
+        if conditional:
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        with self._host_slot(url):
+            _reset_setup()
+            start = time.perf_counter()
+            try:
+                with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    headers_received = time.perf_counter()
+                    try:
+                        body = response.content
+                    except requests.RequestException as ex:
+                        print("Response body cut off: ", redact(str(ex)))
+                        body = None
+                    done = time.perf_counter()
+                    wire_bytes = response.raw.tell()
+            except requests.RequestException as ex:
+                if not (_setup.reused or _setup.connected):
+                    raise
+                # Sent, but no answer (read timeout, connection dropped)
+                print("No response: ", redact(str(ex)))
+                return JSONResponse(None, None)
+        setup = _setup.dns + _setup.connect + _setup.tls
+        self.timings.append(RequestTiming(redact(url), response.status_code,
+                                          _setup.reused, _setup.dns, _setup.connect, _setup.tls,
+                                          max(headers_received - start - setup, 0.0),
+                                          done - headers_received, done - start,
+                                          wire_bytes, 0 if body is None else len(body)))
+
+        if response.status_code != 200 or body is None:
+            return JSONResponse(response.status_code, None)
+        try:
+            data = response.json()
+        except ValueError as ex:
+            print("Response body is not JSON: ", ex)
+            return JSONResponse(200, None)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            with self._lock:
+                self._validators[url] = (etag, last_modified)
+        return JSONResponse(200, data)
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+        return slot
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def http_client():
+    """Return the shared HTTPClient."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
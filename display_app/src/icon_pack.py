@@ -0,0 +1,118 @@
+# Weather icons pre-converted to panel-ready 565 RGB and packed into a single file.
+# At runtime the pack is memory-mapped, so drawing an icon is a slice of the mmap
+# instead of opening, decoding and converting a BMP.
+# Rebuild the pack by hand with: python3 -m src.icon_pack (from the display_app directory).
+# It is also rebuilt automatically when it is missing or older than the BMPs.
+#
+# File layout (all integers little-endian):
+#   header: magic b"RGB565PK", version u16, entry count u16
+#   index:  per entry name (24 bytes, utf-8, NUL padded), width u16, height u16, offset u32
+#   pixels: width*height big-endian 565 pixels per entry, at the offset from the index
+
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .lib_tft24T import rgb_to_565
+
+resources_path = Path(__file__).resolve().parents[1].joinpath("resources")
+PACK_PATH = resources_path.joinpath("icons.rgb565")
+# Icon sets that go into the pack, by directory name under resources/
+ICON_SETS = ("SmallIcons", "LargeIcons")
+
+PACK_MAGIC = b"RGB565PK"
+PACK_VERSION = 1
+HEADER = struct.Struct("<8sHH")
+ENTRY = struct.Struct("<24sHHI")
+
+
+def _source_files(sets=ICON_SETS):
+    files = []
+    for icon_set in sets:
+        files.extend(sorted(resources_path.joinpath(icon_set).glob("*.bmp")))
+    return files
+
+
+def compile_icon_pack(out_path=PACK_PATH, sets=ICON_SETS):
+    """Convert every BMP in the icon sets to 565 RGB and write them as one indexed pack."""
+    entries = []
+    for path in _source_files(sets):
+        with Image.open(path) as image:
+            pixels = rgb_to_565(np.asarray(image.convert("RGB")))
+        entries.append((path.parent.name + "/" + path.stem, pixels))
+
+    offset = HEADER.size + ENTRY.size * len(entries)
+    index = []
+    for name, pixels in entries:
+        height, width = pixels.shape
+        index.append(ENTRY.pack(name.encode("utf-8"), width, height, offset))
+        offset += pixels.nbytes
+
+    # Write next to the target and rename, so a reader never maps a half written pack
+    out_path = Path(out_path)
+    fd, tmp_path = tempfile.mkstemp(dir=str(out_path.parent), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, len(entries)))
+            f.writelines(index)
+            for _, pixels in entries:
+                f.write(pixels.tobytes())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, str(out_path))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return out_path
+
+
+class IconPack:
+    """Read-only view of a compiled icon pack."""
+
+    def __init__(self, path=PACK_PATH):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError("{} is not a version {} icon pack".format(path, PACK_VERSION))
+        self._icons = {}
+        for i in range(count):
+            name, width, height, offset = ENTRY.unpack_from(self._mmap, HEADER.size + i * ENTRY.size)
+            pixels = np.frombuffer(self._mmap, dtype=np.uint16, count=width * height, offset=offset)
+            self._icons[name.rstrip(b"\0").decode("utf-8")] = pixels.reshape(height, width)
+
+    def get(self, icon_set, icon_id):
+        """Return the icon as a (height, width) array of wire order 565 pixels backed by the mmap."""
+        return self._icons[icon_set + "/" + icon_id]
+
+    def blit(self, TFT, icon_set, icon_id, x0, y0):
+        """Draw an icon with its top left corner at x0, y0."""
+        TFT.display_pixels(self.get(icon_set, icon_id), x0, y0)
+
+
+def _is_stale(path):
+    try:
+        built = path.stat().st_mtime
+    except OSError:
+        return True
+    return any(source.stat().st_mtime > built for source in _source_files())
+
+
+_pack = None
+
+def icon_pack():
+    """Return the shared icon pack, compiling it first if it is missing or out of date."""
+    global _pack
+    if _pack is None:
+        if _is_stale(PACK_PATH):
+            compile_icon_pack()
+        _pack = IconPack()
+    return _pack
+
+
+if __name__ == "__main__":
+    print("Wrote", compile_icon_pack())
@@ -1,45 +1,71 @@
-import spidev
 from time import sleep, mktime
 from datetime import datetime
-import RPi.GPIO as GPIO
 import signal
 from pathlib import Path
 
+from .hal import backend
 from .weather_display import WeatherDisplay
 from .hourly_forecast import HourlyForecastDisplay
 from .daily_forecast import DailyForecastDisplay
 from .lib_tft24T import TFT24T
+from .panels import Panel, PanelScheduler
+from .weather_store import WeatherRefresher, weather_stores
+from .room_sensor import room_sensor
+from .utils import LOCATIONS, DEFAULT_LOCATION
+from .touch import TouchEngine, TAP, SWIPE_LEFT, SWIPE_RIGHT, SWIPE_UP, SWIPE_DOWN
+
+# spidev/RPi.GPIO, or the virtual board when DISPLAY_APP_BACKEND=virtual
+hw = backend()
+GPIO = hw.GPIO
 
 # GPIO configuration
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
 
-# TFT pins
-DC = 24
-RST = 25
-LED = 15
+# Touchscreen pen interrupt (the touch controller is on the first panel)
 TOUCH_IRQ = 16
 
-# Create TFT LCD/TOUCH object:
-TFT = TFT24T(spidev.SpiDev(), GPIO, landscape=False)
+# Send SPI traffic from a background thread so rendering overlaps with transfers
+ASYNC_SPI = True
 
-# Displays definition
-weather_display = WeatherDisplay()
-hourly_forecast_display = HourlyForecastDisplay()
-daily_forecast_display = DailyForecastDisplay()
-images_path = Path(__file__).resolve().parents[1].joinpath('resources/Images')
+# Page types by name, for the panel configuration
+PAGES = {"weather": WeatherDisplay, "hourly": HourlyForecastDisplay, "daily": DailyForecastDisplay}
 
-# Displays are storred in an array and called in infinite loop
-dislpays = [weather_display, hourly_forecast_display, daily_forecast_display]
+# One entry per TFT panel: SPI bus and chip select, DC/RESET/LED pins, the pages it shows and,
+# optionally, the location they are for (a name from utils.LOCATIONS, default DEFAULT_LOCATION).
+# The first panel has the touchscreen, and its pages are switched with gestures; every other
+# panel shows its first page. Panels on different buses are refreshed concurrently.
+PANELS = [
+    {"bus": 0, "ce": 0, "dc": 24, "rst": 25, "led": 15, "pages": ["weather", "hourly", "daily"]},
+    # A second panel on SPI0 CE1, or on one of the Pi 4's extra buses, e.g.:
+    # {"bus": 3, "ce": 0, "dc": 23, "rst": 22, "led": None, "pages": ["daily"], "location": "blagoevgrad"},
+]
 
-displays_number = len(dislpays)
-active_display = 0
+images_path = Path(__file__).resolve().parents[1].joinpath('resources/Images')
 
-# TFT touch interrupt callback
-def touch_irq_callback(channel):
-    global active_display, displays_number
-    active_display = (active_display + 1) % displays_number
-    print("Active display: ", active_display)
+panels = [Panel(TFT24T(hw.spidev.SpiDev(), GPIO, landscape=False),
+                [PAGES[name](*LOCATIONS[config.get("location", DEFAULT_LOCATION)]) for name in config["pages"]],
+                bus=config["bus"], ce=config["ce"], dc=config["dc"], rst=config["rst"], led=config["led"])
+          for config in PANELS]
+
+# Page navigation from touch gestures: swipe left/tap for the next page, swipe right for the previous one,
+# swipe up/down scrolls the active page. Returns True if the active page changed.
+def handle_touch_event(event, panel):
+    if event.kind == SWIPE_UP:
+        panel.page.scroll(panel.tft, 1)
+        return False
+    if event.kind == SWIPE_DOWN:
+        panel.page.scroll(panel.tft, -1)
+        return False
+    if event.kind in (SWIPE_LEFT, TAP):
+        step = 1
+    elif event.kind == SWIPE_RIGHT:
+        step = -1
+    else:
+        return False
+    panel.show(step)
+    print("Active display: ", panel.active)
+    return True
 
 # Code for graceful shutdown copied from https://stackoverflow.com/questions/18499497/how-to-process-sigterm-signal-gracefully
 class GracefulKiller:
@@ -59,31 +85,52 @@ class InfoDisplay():
     def run():
         killer = GracefulKiller()
 
-        # Add interrupt handler for the touchscreen
-        GPIO.setup(TOUCH_IRQ, GPIO.IN)
-        GPIO.add_event_detect(TOUCH_IRQ, edge=GPIO.FALLING, callback=touch_irq_callback, bouncetime=300)
-
-        # Initialize display.
-        TFT.initLCD(DC, RST, LED)
+        # Initialize displays.
+        for panel in panels:
+            panel.start(ASYNC_SPI)
+        scheduler = PanelScheduler(panels)
+
+        # Weather is fetched in the background, so drawing never waits for the network;
+        # the locations shown are fetched concurrently
+        refresher = WeatherRefresher(weather_stores())
+        refresher.start()
+        # The BME280 is read on its own thread too
+        sensor = room_sensor()
+        sensor.start()
+
+        # Touchscreen: gestures are picked up by a thread woken by the T_IRQ interrupt
+        touch_panel = panels[0]
+        touch_panel.tft.initTOUCH(TOUCH_IRQ)
+        touch = TouchEngine(touch_panel.tft)
+        touch.start()
 
         # Get time in seconds
         dti = mktime(datetime.now().timetuple())
 
         while not killer.kill_now:
+            # Switch pages as soon as a gesture arrives rather than on the next second
+            redraw = False
+            while not touch.events.empty():
+                if handle_touch_event(touch.events.get(), touch_panel):
+                    redraw = True
+
             # Get time in seconds and compare it to last timestamp. If a second has expired, 
             # save current timestamp and do stuff
             ndti = mktime(datetime.now().timetuple())
             if dti < ndti:
                 dti = ndti
 
-                # Draw current display
-                dislpays[active_display].draw(TFT)
-
-                # Sleep to avoid runnign through the loop constantly
-                sleep(0.5)
+                # Draw the current page of every panel
+                scheduler.refresh()
+            elif redraw:
+                touch_panel.draw()
             else:
                 sleep(0.01)
 
         print("Goodbye!")
-        TFT.backlite(False)
-        TFT.command(0x28)
+        touch.stop()
+        refresher.stop()
+        sensor.stop()
+        scheduler.shutdown()
+        for panel in panels:
+            panel.close()
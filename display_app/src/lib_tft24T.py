@@ -20,9 +20,13 @@ margin = 13
 
 
 import numbers
+import queue
+import sys
+import threading
 import time
 import numpy as np
 from PIL import Image
+from PIL import ImageColor
 from PIL import ImageDraw
 import textwrap
 
@@ -60,6 +64,8 @@ ILI9341_RAMWR       = 0x2C
 ILI9341_RAMRD       = 0x2E
 
 ILI9341_PTLAR       = 0x30
+ILI9341_VSCRDEF     = 0x33
+ILI9341_VSCRSADD    = 0x37
 ILI9341_MADCTL      = 0x36
 ILI9341_PIXFMT      = 0x3A
 
@@ -87,6 +93,51 @@ ILI9341_GMCTRN1     = 0xE1
 
 ILI9341_PWCTR6      = 0xFC
 
+# Panel bring-up as (command, parameter bytes, seconds to wait afterwards).
+# Other ILI9341 modules/variants can pass their own table to TFT24T(init_sequence=...).
+ILI9341_INIT_SEQUENCE = (
+    (0xEF,              b"\x03\x80\x02", 0),
+    (0xCF,              b"\x00\xC1\x30", 0),               # Power control B
+    (0xED,              b"\x64\x03\x12\x81", 0),           # Power on sequence control
+    (0xE8,              b"\x85\x00\x78", 0),               # Driver timing control A
+    (0xCB,              b"\x39\x2C\x00\x34\x02", 0),       # Power control A
+    (0xF7,              b"\x20", 0),                       # Pump ratio control
+    (0xEA,              b"\x00\x00", 0),                   # Driver timing control B
+    (ILI9341_PWCTR1,    b"\x23", 0),                       # Power control, VRH[5:0]
+    (ILI9341_PWCTR2,    b"\x10", 0),                       # Power control, SAP[2:0];BT[3:0]
+    (ILI9341_VMCTR1,    b"\x3E\x28", 0),                   # VCM control
+    (ILI9341_VMCTR2,    b"\x86", 0),                       # VCM control2
+    (ILI9341_MADCTL,    b"\x48", 0),                       # Memory Access Control
+    (ILI9341_PIXFMT,    b"\x55", 0),                       # 16 bits per pixel
+    (ILI9341_FRMCTR1,   b"\x00\x18", 0),
+    (ILI9341_DFUNCTR,   b"\x08\x82\x27", 0),               # Display Function Control
+    (0xF2,              b"\x00", 0),                       # 3Gamma Function Disable
+    (ILI9341_GAMMASET,  b"\x01", 0),                       # Gamma curve selected
+    (ILI9341_GMCTRP1,   b"\x0F\x31\x2B\x0C\x0E\x08\x4E\xF1\x37\x07\x10\x03\x0E\x09\x00", 0),    # Set Gamma
+    (ILI9341_GMCTRN1,   b"\x00\x0E\x14\x03\x11\x07\x31\xC1\x48\x08\x0F\x0C\x31\x36\x0F", 0),    # Set Gamma
+    (ILI9341_SLPOUT,    b"", 0.005),                        # Exit Sleep, 5 ms before the next command
+    (ILI9341_DISPON,    b"", 0),                            # Display on
+)
+
+# Orientation is done by the panel: the row/column exchange and mirror bits of MADCTL
+# (MY 0x80, MX 0x40, MV 0x20) make the memory window address the screen the way the
+# application sees it, so no pixels are rotated on the CPU. The other MADCTL bits
+# (BGR etc.) come from the init table.
+ILI9341_MADCTL_ROTATION = 0xE0
+ILI9341_MADCTL_PORTRAIT = 0x40          # MX: 0x48 with BGR, 240x320
+ILI9341_MADCTL_LANDSCAPE = 0xE0         # MY|MX|MV: 0xE8 with BGR, 320x240
+
+
+def portrait_to_landscape(x, y):
+    # Screen coordinates under ILI9341_MADCTL_LANDSCAPE of the native portrait point x, y
+    return ILI9341_TFTHEIGHT-1 - y, x
+
+# Reset timing from the ILI9341 datasheet: the reset pulse needs 10 us, commands may
+# follow 5 ms after reset, but Sleep Out must wait 120 ms after a reset.
+ILI9341_RESET_PULSE = 0.0001
+ILI9341_RESET_SETTLE = 0.005
+ILI9341_RESET_SLPOUT_DELAY = 0.120
+
 ILI9341_BLACK       = 0x0000
 ILI9341_BLUE        = 0x001F
 ILI9341_RED         = 0xF800
@@ -97,17 +148,164 @@ ILI9341_YELLOW      = 0xFFE0
 ILI9341_WHITE       = 0xFFFF
 
 
-Buffer = None
-# textrotated custom method for our "draw" cannot find TFT's canvas buffer if it is not global.
-# This method obviously precludes multiple instances of TFT running independently,
-# but we use both CE0/CE1 of the Raspberry Pi anyway, so how could we have another display?
-# (Want the second SPI of the RPI2? - Not considered in this library)
+SPIDEV_BUFSIZ_PATH = "/sys/module/spidev/parameters/bufsiz"
+SPIDEV_DEFAULT_BUFSIZ = 4096
+
+def spidev_bufsiz(path=SPIDEV_BUFSIZ_PATH):
+    # Largest single transfer the kernel spidev driver accepts (module parameter
+    # "bufsiz", 4096 unless raised with spidev.bufsiz=... in cmdline.txt)
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return SPIDEV_DEFAULT_BUFSIZ
+
+
+# Dirty rectangles closer than this many pixels are merged into one window;
+# a new window costs a CASET/PASET/RAMWR header and a handful of DC toggles.
+DIRTY_MERGE_GAP = 8
+# Beyond this many rectangles per band the whole band is sent as one window.
+DIRTY_MAX_RECTS = 8
+
+def _runs(flags, gap):
+    # (start, end) index pairs of the True runs in a 1-D bool array,
+    # with runs separated by fewer than gap False entries merged together.
+    idx = np.flatnonzero(flags)
+    if idx.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > gap)
+    starts = np.concatenate(([idx[0]], idx[breaks + 1]))
+    ends = np.concatenate((idx[breaks], [idx[-1]]))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def dirty_rects(changed, gap=DIRTY_MERGE_GAP, max_rects=DIRTY_MAX_RECTS):
+    """Merge a 2-D bool mask of changed pixels into a few (x0, y0, x1, y1) rectangles (inclusive)."""
+    rects = []
+    for by0, by1 in _runs(changed.any(axis=1), gap):
+        band = changed[by0:by1+1]
+        columns = _runs(band.any(axis=0), gap)
+        if len(columns) > max_rects:
+            columns = [(columns[0][0], columns[-1][1])]
+        for x0, x1 in columns:
+            rows = np.flatnonzero(band[:, x0:x1+1].any(axis=1))
+            rects.append((x0, by0 + int(rows[0]), x1, by0 + int(rows[-1])))
+    return rects
+
+
+def _owned(data):
+    # A private copy of command/data for the writer queue
+    if isinstance(data, (bytes, numbers.Number)):
+        return data
+    if isinstance(data, list):
+        return list(data)
+    return bytes(memoryview(data).cast('B'))
+
+def robust_mean(values, k=2.0):
+    # Mean of the samples within k median absolute deviations of the median.
+    # Touch panels produce the odd wild reading while the pen settles.
+    values = np.asarray(values, dtype=np.float64)
+    median = np.median(values)
+    deviation = np.abs(values - median)
+    mad = np.median(deviation)
+    if mad == 0:
+        return float(median)
+    return float(values[deviation <= k * mad].mean())
+
+def color565(color):
+    """Wire order 565 value (as stored in the frame arrays) for a colour in any notation below."""
+    if isinstance(color, str):
+        r, g, b = ImageColor.getrgb(color)[:3]
+    elif isinstance(color, numbers.Number):
+        # 0xBBGGRR, as PIL takes it
+        r, g, b = color & 0xFF, (color >> 8) & 0xFF, (color >> 16) & 0xFF
+    else:
+        r, g, b = color[:3]
+    value = ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+    if sys.byteorder == 'little':
+        value = ((value & 0xFF) << 8) | (value >> 8)
+    return value
+
+def rgb_to_565(pb, color=None, scratch=None):
+    """Pack an (height, width, 3) uint8 RGB array into uint16 565 pixels in wire (big-endian) order.
+
+    color and scratch are optional preallocated (height, width) uint16 arrays;
+    the result is written into color.
+    """
+    #NumPy is much faster at doing this. NumPy code originally provided by:
+    #Keith (https://www.blogger.com/profile/02555547344016007163)
+    if color is None:
+        color = np.empty(pb.shape[:2], dtype=np.uint16)
+    if scratch is None:
+        scratch = np.empty(pb.shape[:2], dtype=np.uint16)
+    np.copyto(color, pb[:,:,0])
+    color &= 0xF8
+    color <<= 8
+    np.copyto(scratch, pb[:,:,1])
+    scratch &= 0xFC
+    scratch <<= 3
+    color |= scratch
+    np.copyto(scratch, pb[:,:,2])
+    scratch >>= 3
+    color |= scratch
+    if sys.byteorder == 'little':
+        # The panel wants the high byte first
+        color.byteswap(inplace=True)
+    return color
+
+
+# Every TFT24T has its own canvas (self.buffer), so several panels - on CE0/CE1 or on
+# the other SPI buses - can be driven from one process.
 
 class TFT24T():
-    def __init__(self, spi, gpio, landscape=False):
+    def __init__(self, spi, gpio, landscape=False, init_sequence=None):
         self.is_landscape = landscape
+        self.init_sequence = ILI9341_INIT_SEQUENCE if init_sequence is None else init_sequence
+        self._reset_time = None
         self._spi = spi
         self._gpio = gpio
+        # Preallocated RGB565 conversion buffers, keyed by (height, width)
+        self._rgb565_cache = {}
+        self._spi_tch = None
+        # LCD SPI session state: the device is opened once in initLCD and kept open
+        self._spi_open = False
+        self._dc_state = None
+        self._window = None
+        self._chunk_size = spidev_bufsiz()
+        # Frame composed by the draw calls, and a shadow of what is physically in the
+        # panel's memory. Both hold 565 RGB pixels in wire (big-endian) byte order.
+        # Both are in screen coordinates of the current orientation, (height, width).
+        self._frame = np.zeros((self.height, self.width), dtype=np.uint16)
+        self._shadow = np.zeros((self.height, self.width), dtype=np.uint16)
+        # Pixels whose panel contents are unknown (None when all are known)
+        self._shadow_unknown = np.ones((self.height, self.width), dtype=bool)
+        self._deferred = 0
+        # Bounding box (x0, y0, x1, y1) of what was drawn since begin_frame(), or None
+        self._pending = None
+        # Pre-packed chunks of solid colour for fill_rect, keyed by wire order 565 value
+        self._fill_patterns = {}
+        # Vertical scroll state: (top fixed, scroll area, bottom fixed) lines and start line
+        self._scroll_area = (0, ILI9341_TFTHEIGHT, 0)
+        self._scroll_start = 0
+        # Optional background SPI writer (see start_writer)
+        self._writer = None
+        self._writer_queue = None
+        # PIL canvas for draw()/display(), and a backup buffer for backup/restore
+        self.buffer = Image.new('RGB', (self.width, self.height))
+        self.buffer2 = self.buffer.copy()
+
+    @property
+    def width(self):
+        # Width of the drawing surface in the current orientation
+        return ILI9341_TFTHEIGHT if self.is_landscape else ILI9341_TFTWIDTH
+
+    @property
+    def height(self):
+        return ILI9341_TFTWIDTH if self.is_landscape else ILI9341_TFTHEIGHT
+
+    @property
+    def madctl_rotation(self):
+        # MADCTL MY/MX/MV bits for the current orientation
+        return ILI9341_MADCTL_LANDSCAPE if self.is_landscape else ILI9341_MADCTL_PORTRAIT
 
 # TOUCHSCREEN HARDWARE PART
     # ads7843 max spi speed 2 MHz?
@@ -116,194 +314,240 @@ class TFT24T():
     Z1 = 0xB0
     Z2 = 0xC0
 
-    def initTOUCH(self, pen,  ce=0,  spi_speed=100000):
+    def initTOUCH(self, pen,  ce=0,  spi_speed=100000, bus=1):
         self._ce_tch = ce
         self._spi_speed_tch=spi_speed
         self._pen = pen
         self._gpio.setup(pen, self._gpio.IN)
+        # The touch controller gets its own SpiDev so it does not disturb the
+        # LCD session, and it stays open as well.
+        self._spi_tch = type(self._spi)()
+        self._spi_tch.open(bus, self._ce_tch)
+        self._spi_tch.max_speed_hz=self._spi_speed_tch
+
+    def add_pen_callback(self, callback):
+        # callback(channel) is called from the GPIO thread when the pen touches down
+        self._gpio.add_event_detect(self._pen, self._gpio.FALLING, callback=callback)
+
+    def remove_pen_callback(self):
+        self._gpio.remove_event_detect(self._pen)
 
     def penDown(self):
         # reads True when stylus is in contact
         return not self._gpio.input(self._pen)
 
     def readValue(self, channel):
-        self._spi.open(1,self._ce_tch)
-        self._spi.max_speed_hz=self._spi_speed_tch
-
-        responseData = self._spi.xfer([channel , 0, 0])
-        self._spi.close()
+        responseData = self._spi_tch.xfer([channel , 0, 0])
         return (responseData[1] << 5) | (responseData[2] >> 3)
         # Pick off the 12-bit reply
 
-    def penPosition(self):
-        self.readValue(self.X)
-        self.readValue(self.Y)
-        self.readValue(self.X)
-        self.readValue(self.Y)
-        # burn those
-        x=0
-        y=0
-        for k in range(10):
-            x += self.readValue(self.X)
-            y += self.readValue(self.Y)
-        # average those
-        x = x / 10
-        y = y / 10
+    def readBurst(self, samples=16):
+        """Sample X and Y "samples" times in a single SPI transfer. Returns two uint16 arrays."""
+        responseData = self._spi_tch.xfer2([self.X, 0, 0, self.Y, 0, 0] * samples)
+        r = np.array(responseData, dtype=np.uint16).reshape(samples, 6)
+        # Pick off the 12-bit replies
+        return (r[:,1] << 5) | (r[:,2] >> 3), (r[:,4] << 5) | (r[:,5] >> 3)
+
+    def penPosition(self, samples=14):
+        xs, ys = self.readBurst(samples + 2)
+        # burn the first two pairs, then drop outliers and average the rest
+        return self.raw_to_position(robust_mean(xs[2:]), robust_mean(ys[2:]))
+
+    def raw_to_position(self, x, y):
+        """Convert 12-bit touch controller readings to screen coordinates ([0, 0] in the margin)."""
         # empirically set calibration factors:
         x2 = (4096 -x) * calib_scale240 / 4096   -calib_offset240
         y2 = y * calib_scale320 / 4096   - calib_offset320
         # So far, these co-ordinates are the native portrait mode
 
-        if y2<margin or y2>(319-margin) or x2<margin or x2 > (239-margin):
-            x2=0
-            y2=0
         # The fringes of touchscreen give a lot of erratic/spurious results
         # Don't allow fringes to return anything.
         # (Also, user should not program hotspots/icons out in the margin, to discourage pointing pen there)
-        # a return of (0,0) is considered a nul return
+        # a return of (0,0) is considered a nul return, in either orientation
+        if y2<margin or y2>(319-margin) or x2<margin or x2 > (239-margin):
+            return [0, 0]
 
         if self.is_landscape:
-            # rotate the coordinates
-            x3 = x2
-            x2 = 319-y2
-            y2 = x3
+            x2, y2 = portrait_to_landscape(x2, y2)
         return [x2, y2]
 
 
 #    TFT/LCD part
 
-    def send2lcd(self, data, is_data=True, chunk_size=4096):
-
-        # Set DC low for command, high for data.
-        self._gpio.output(self._dc, is_data)
-        self._spi.open(0, self._ce_lcd)
-        self._spi.max_speed_hz=self._spi_speed_lcd
+    def open_spi(self):
+        """Open the LCD SPI device once and keep it open for the lifetime of the TFT."""
+        if not self._spi_open:
+            self._spi.open(self._bus_lcd, self._ce_lcd)
+            self._spi.max_speed_hz=self._spi_speed_lcd
+            self._spi_open = True
+            self._dc_state = None
+
+    def close(self):
+        """Close the SPI sessions. The TFT must be re-initialised before further use."""
+        self.stop_writer()
+        if self._spi_open:
+            self._spi.close()
+            self._spi_open = False
+        if self._spi_tch is not None:
+            self._spi_tch.close()
+            self._spi_tch = None
+        self._window = None
+
+    def send2lcd(self, data, is_data=True, chunk_size=None):
+
+        if not self._spi_open:
+            self.open_spi()
+        # Set DC low for command, high for data. Only touch the pin when it changes.
+        if self._dc_state is not is_data:
+            self._gpio.output(self._dc, is_data)
+            self._dc_state = is_data
+        if chunk_size is None:
+            chunk_size = self._chunk_size
 
         # Convert scalar argument to list so either can be passed as parameter.
         if isinstance(data, numbers.Number):
             data = [data & 0xFF]
-        # Write data a chunk at a time.
-        for start in range(0, len(data), chunk_size):
-            end = min(start+chunk_size, len(data))
-            self._spi.writebytes(data[start:end])
-        self._spi.close()
+        if isinstance(data, list):
+            # Write data a chunk at a time.
+            for start in range(0, len(data), chunk_size):
+                end = min(start+chunk_size, len(data))
+                self._spi.writebytes(data[start:end])
+        else:
+            # bytes/bytearray/memoryview/numpy buffers go out without being copied
+            # into Python lists. writebytes2 (spidev >= 3.4) accepts any buffer.
+            view = memoryview(data).cast('B')
+            for start in range(0, len(view), chunk_size):
+                self._spi.writebytes2(view[start:start+chunk_size])
 
     def command(self, data):
         """Write a byte or array of bytes to the display as command data."""
-        self.send2lcd(data, False)
+        self.submit([(False, data)])
 
     def data(self, data):
         """Write a byte or array of bytes to the display as display data."""
-        self.send2lcd(data, True)
+        self.submit([(True, data)])
+
+    def window_transaction(self, x0, y0, x1, y1, payload=None):
+        """Build the (is_data, bytes) steps that address a window and write payload into it.
+
+        CASET/PASET are left out when the panel already has that column/page
+        range latched from the previous window, so repeated writes to the same
+        box cost a single RAMWR command plus the pixels.
+        """
+        steps = []
+        window = self._window
+        if window is None or window[0] != x0 or window[2] != x1:
+            steps.append((False, bytes((ILI9341_CASET,))))
+            steps.append((True, bytes((x0 >> 8, x0 & 0xFF, x1 >> 8, x1 & 0xFF))))
+        if window is None or window[1] != y0 or window[3] != y1:
+            steps.append((False, bytes((ILI9341_PASET,))))
+            steps.append((True, bytes((y0 >> 8, y0 & 0xFF, y1 >> 8, y1 & 0xFF))))
+        steps.append((False, bytes((ILI9341_RAMWR,))))
+        if payload is not None:
+            steps.append((True, payload))
+        self._window = (x0, y0, x1, y1)
+        return steps
+
+    def submit(self, steps):
+        """Send a list of (is_data, data) steps over the open SPI session.
+
+        With the background writer running the steps are queued instead; this
+        blocks while the queue is full, so rendering can get at most one
+        transaction ahead of the bus.
+        """
+        if self._writer is None:
+            for is_data, data in steps:
+                self.send2lcd(data, is_data)
+        else:
+            # The caller may reuse its buffers as soon as we return, so the queue
+            # gets its own copy of every payload.
+            self._writer_queue.put([(is_data, _owned(data)) for is_data, data in steps])
+
+    # Background SPI writer
+
+    def start_writer(self, depth=2):
+        """Send SPI traffic from a dedicated thread so rendering overlaps with transfers.
+
+        depth is the number of queued transactions (2 = double buffered).
+        """
+        if self._writer is not None:
+            return
+        self._writer_queue = queue.Queue(maxsize=depth)
+        self._writer = threading.Thread(target=self._writer_loop, name="tft-spi-writer", daemon=True)
+        self._writer.start()
+
+    def flush(self):
+        """Wait until every queued transaction has been sent to the panel."""
+        if self._writer is not None:
+            self._writer_queue.join()
+
+    def stop_writer(self):
+        """Flush the queue and stop the writer thread; output becomes synchronous again."""
+        if self._writer is None:
+            return
+        self._writer_queue.put(None)
+        self._writer.join()
+        self._writer = None
+        self._writer_queue = None
+
+    def _writer_loop(self):
+        while True:
+            steps = self._writer_queue.get()
+            try:
+                if steps is None:
+                    return
+                for is_data, data in steps:
+                    self.send2lcd(data, is_data)
+            except Exception as ex:
+                print("Exception in TFT SPI writer: ", ex)
+            finally:
+                self._writer_queue.task_done()
+
+    def write_window(self, x0, y0, x1, y1, payload):
+        """Write a 565 RGB pixel buffer into the panel window x0,y0 - x1,y1 (inclusive)."""
+        self.submit(self.window_transaction(x0, y0, x1, y1, payload))
 
     def resetlcd(self):
+        # Anything still queued belongs to the panel state we are about to reset
+        self.flush()
         if self._rst is not None:
-            self._gpio.output(self._rst, self._gpio.HIGH)
-            time.sleep(0.005)
             self._gpio.output(self._rst, self._gpio.LOW)
-            time.sleep(0.02)
+            time.sleep(ILI9341_RESET_PULSE)
             self._gpio.output(self._rst, self._gpio.HIGH)
-            time.sleep(0.150)
         else:
             self.command(ILI9341_SWRESET)
-            sleep(1)
+        self._reset_time = time.monotonic()
+        time.sleep(ILI9341_RESET_SETTLE)
+
+    def run_init_sequence(self, sequence):
+        """Replay a table of (command, parameter bytes, delay) entries over the open SPI session."""
+        for cmd, params, delay in sequence:
+            if cmd == ILI9341_SLPOUT and self._reset_time is not None:
+                # Only Sleep Out has to wait for the full post-reset delay, so the
+                # rest of the table goes out while the panel settles.
+                remaining = ILI9341_RESET_SLPOUT_DELAY - (time.monotonic() - self._reset_time)
+                if remaining > 0:
+                    time.sleep(remaining)
+            if cmd == ILI9341_MADCTL and params:
+                # The orientation bits follow is_landscape, whatever the table says
+                params = bytes((params[0] & ~ILI9341_MADCTL_ROTATION | self.madctl_rotation,)) + params[1:]
+            steps = [(False, bytes((cmd,)))]
+            if params:
+                steps.append((True, params))
+            self.submit(steps)
+            if delay:
+                time.sleep(delay)
 
     def _init9341(self):
         # Initialize the display.  Broken out as a separate function so it can
-		# be overridden by other displays in the future.
-        self.command(0xEF)
-        self.data(0x03)
-        self.data(0x80)
-        self.data(0x02)
-        self.command(0xCF)
-        self.data(0x00)
-        self.data(0XC1)
-        self.data(0X30)
-        self.command(0xED)
-        self.data(0x64)
-        self.data(0x03)
-        self.data(0X12)
-        self.data(0X81)
-        self.command(0xE8)
-        self.data(0x85)
-        self.data(0x00)
-        self.data(0x78)
-        self.command(0xCB)
-        self.data(0x39)
-        self.data(0x2C)
-        self.data(0x00)
-        self.data(0x34)
-        self.data(0x02)
-        self.command(0xF7)
-        self.data(0x20)
-        self.command(0xEA)
-        self.data(0x00)
-        self.data(0x00)
-        self.command(ILI9341_PWCTR1)	# Power control 
-        self.data(0x23)					# VRH[5:0] 
-        self.command(ILI9341_PWCTR2)	# Power control 
-        self.data(0x10)					# SAP[2:0];BT[3:0] 
-        self.command(ILI9341_VMCTR1)	# VCM control 
-        self.data(0x3e)
-        self.data(0x28)
-        self.command(ILI9341_VMCTR2)	# VCM control2 
-        self.data(0x86)					# --
-        self.command(ILI9341_MADCTL)	#  Memory Access Control 
-        self.data(0x48)
-        self.command(ILI9341_PIXFMT)
-        self.data(0x55)
-        self.command(ILI9341_FRMCTR1)
-        self.data(0x00)
-        self.data(0x18)
-        self.command(ILI9341_DFUNCTR)	#  Display Function Control 
-        self.data(0x08)
-        self.data(0x82)
-        self.data(0x27)
-        self.command(0xF2)				#  3Gamma Function Disable 
-        self.data(0x00)
-        self.command(ILI9341_GAMMASET)	# Gamma curve selected 
-        self.data(0x01)
-        self.command(ILI9341_GMCTRP1)	# Set Gamma 
-        self.data(0x0F)
-        self.data(0x31)
-        self.data(0x2B)
-        self.data(0x0C)
-        self.data(0x0E)
-        self.data(0x08)
-        self.data(0x4E)
-        self.data(0xF1)
-        self.data(0x37)
-        self.data(0x07)
-        self.data(0x10)
-        self.data(0x03)
-        self.data(0x0E)
-        self.data(0x09)
-        self.data(0x00)
-        self.command(ILI9341_GMCTRN1)	# Set Gamma 
-        self.data(0x00)
-        self.data(0x0E)
-        self.data(0x14)
-        self.data(0x03)
-        self.data(0x11)
-        self.data(0x07)
-        self.data(0x31)
-        self.data(0xC1)
-        self.data(0x48)
-        self.data(0x08)
-        self.data(0x0F)
-        self.data(0x0C)
-        self.data(0x31)
-        self.data(0x36)
-        self.data(0x0F)
-        self.command(ILI9341_SLPOUT)	# Exit Sleep 
-        time.sleep(0.120)
-        self.command(ILI9341_DISPON)	# Display on 
-
-    def initLCD(self, dc=None, rst=None, led=None, ce=0, spi_speed=32000000):
-        global Buffer
+        # be overridden by other displays in the future.
+        self.run_init_sequence(self.init_sequence)
+
+    def initLCD(self, dc=None, rst=None, led=None, ce=0, spi_speed=32000000, bus=0):
         self._dc = dc
         self._rst = rst
         self._led = led
+        self._bus_lcd = bus
         self._ce_lcd = ce
         self._spi_speed_lcd=spi_speed
         # Set DC as output.
@@ -315,106 +559,216 @@ class TFT24T():
             self._gpio.setup(led, self._gpio.OUT)
             self._gpio.output(led, self._gpio.HIGH)
 
-        # Create an image buffer.
-        if self.is_landscape:
-            Buffer = Image.new('RGB', (ILI9341_TFTHEIGHT, ILI9341_TFTWIDTH))
-        else:
-            Buffer = Image.new('RGB', (ILI9341_TFTWIDTH, ILI9341_TFTHEIGHT))
-        # and a backup buffer for backup/restore
-        self.buffer2 = Buffer.copy()
+        self.open_spi()
         self.resetlcd()
+        self._window = None
+        self.invalidate()
+        self._scroll_area = (0, ILI9341_TFTHEIGHT, 0)
+        self._scroll_start = 0
         self._init9341()
 
     def set_frame(self, x0=0, y0=0, x1=None, y1=None):
 
         if x1 is None:
-            x1 = ILI9341_TFTWIDTH-1
+            x1 = self.width-1
         if y1 is None:
-            y1 = ILI9341_TFTHEIGHT-1
-        self.command(ILI9341_CASET)        # Column addr
-        self.data([x0 >> 8, x0, x1 >> 8, x1])
-        self.command(ILI9341_PASET)        # Row addr
-        self.data([y0 >> 8, y0, y1 >> 8, y1])
-        self.command(ILI9341_RAMWR)
+            y1 = self.height-1
+        # Column addr (CASET), row addr (PASET), then RAMWR
+        self.submit(self.window_transaction(x0, y0, x1, y1))
 
     def display_block(self, block, x0, y0, x1, y1):
-        self.set_frame(x0, y0, x1, y1)
-        # Convert image to array of 16bit 565 RGB data bytes.
-        pixelbytes = list(self.image_to_data(block))
-        # Write data to hardware.
-        self.data(pixelbytes)
+        # Compose the block into the frame; only changed pixels go to the hardware.
+        self._blit(self._image_to_array(block), x0, y0)
 
 
     def display(self, image=None):
         """Write the display buffer or provided image to the hardware.  If no
         image parameter is provided the display buffer will be written to the
         hardware.  If an image is provided, it should be RGB format and the
-        same dimensions as the display hardware.
+        same dimensions as the screen in its current orientation (MADCTL does the rotation).
         """
         # By default write the internal buffer to the display.
         if image is None:
-            image = Buffer
-        if image.size[0] == 320:
-            image = image.rotate(90)
-
-        # Set address bounds to entire display.
-        self.set_frame()
-        # Convert image to array of 16bit 565 RGB data bytes.
-        pixelbytes = list(self.image_to_data(image))
-        # Write data to hardware.
-        self.data(pixelbytes)
+            image = self.buffer
+        self._blit(self._image_to_array(image), 0, 0)
 
     def penprint(self, position, size, color=(0,0,0) ):
+        # position is in screen coordinates, as returned by penPosition()
         x=position[0]
         y=position[1]
-        if self.is_landscape:
-            # rotate the coordinates. The intrinsic hardware is portrait
-            x3 = x
-            x = y
-            y = 319-x3
-        self.set_frame(x, y-size, x+size, y+size)
-        pixelbytes=[0]*(size*size*8)
-        self.data(pixelbytes)
+        self.fill_rect(x, y-size, x+size, y+size, color)
+
+    def fill_rect(self, x0, y0, x1, y1, color):
+        """Fill the box x0,y0 - x1,y1 (inclusive) with a solid colour."""
+        x0 = max(x0, 0)
+        y0 = max(y0, 0)
+        x1 = min(x1, self.width-1)
+        y1 = min(y1, self.height-1)
+        if x1 < x0 or y1 < y0:
+            return
+        value = color565(color)
+        self._frame[y0:y1+1, x0:x1+1] = value
+        if self._deferred == 0:
+            self._present_region(x0, y0, x1, y1, fill=value)
+        else:
+            self._add_pending(x0, y0, x1, y1)
+
+    def display_pixels(self, pixels, x0, y0):
+        """Write a (height, width) array of wire order 565 pixels with its top left corner at x0, y0."""
+        self._blit(pixels, x0, y0)
+
+    # Shadow framebuffer / dirty rectangle engine
+
+    def begin_frame(self):
+        """Start composing a frame. Draw calls only update the frame until present()."""
+        self._deferred += 1
+
+    def present(self):
+        """Send every region of the composed frame that differs from the panel."""
+        if self._deferred > 0:
+            self._deferred -= 1
+        if self._deferred == 0 and self._pending is not None:
+            # Only the area drawn since begin_frame() can differ from the panel
+            self._present_region(*self._pending)
+            self._pending = None
+
+    def invalidate(self):
+        """Forget what is on the panel, so the next present() resends everything."""
+        self._shadow_unknown = np.ones((self.height, self.width), dtype=bool)
+        self._pending = (0, 0, self.width-1, self.height-1)
+
+    def _add_pending(self, x0, y0, x1, y1):
+        if self._pending is None:
+            self._pending = (x0, y0, x1, y1)
+        else:
+            px0, py0, px1, py1 = self._pending
+            self._pending = (min(px0, x0), min(py0, y0), max(px1, x1), max(py1, y1))
+
+    def _blit(self, pixels, x0, y0):
+        # Copy a 2-D array of wire order 565 pixels into the frame at x0, y0.
+        # Whatever falls outside the screen is cut off.
+        height, width = pixels.shape
+        x1 = min(x0+width, self.width) - 1
+        y1 = min(y0+height, self.height) - 1
+        pixels = pixels[max(-y0, 0):, max(-x0, 0):]
+        x0 = max(x0, 0)
+        y0 = max(y0, 0)
+        if x1 < x0 or y1 < y0:
+            return
+        self._frame[y0:y1+1, x0:x1+1] = pixels[:y1-y0+1, :x1-x0+1]
+        if self._deferred == 0:
+            self._present_region(x0, y0, x1, y1)
+        else:
+            self._add_pending(x0, y0, x1, y1)
+
+    def _fill_pattern(self, value):
+        # One spidev transfer worth of a solid colour, built once per colour
+        pattern = self._fill_patterns.get(value)
+        if pattern is None:
+            pattern = np.full(self._chunk_size // 2, value, dtype=np.uint16).tobytes()
+            self._fill_patterns[value] = pattern
+        return pattern
+
+    def _write_window_fill(self, x0, y0, x1, y1, value):
+        # Stream the cached pattern into the window instead of building the pixel data
+        nbytes = (x1 - x0 + 1) * (y1 - y0 + 1) * 2
+        pattern = self._fill_pattern(value)
+        steps = self.window_transaction(x0, y0, x1, y1)
+        steps.extend([(True, pattern)] * (nbytes // len(pattern)))
+        if nbytes % len(pattern):
+            steps.append((True, pattern[:nbytes % len(pattern)]))
+        self.submit(steps)
+
+    def _present_region(self, x0, y0, x1, y1, fill=None):
+        # Diff a region of the frame against the shadow and send the changed rectangles.
+        # fill is the colour value when the whole region is known to be one solid colour.
+        x0 = max(x0, 0)
+        y0 = max(y0, 0)
+        x1 = min(x1, self.width-1)
+        y1 = min(y1, self.height-1)
+        if x1 < x0 or y1 < y0:
+            return
+        frame = self._frame[y0:y1+1, x0:x1+1]
+        shadow = self._shadow[y0:y1+1, x0:x1+1]
+        changed = frame != shadow
+        if self._shadow_unknown is not None:
+            changed |= self._shadow_unknown[y0:y1+1, x0:x1+1]
+        for rx0, ry0, rx1, ry1 in dirty_rects(changed):
+            if fill is not None:
+                self._write_window_fill(x0+rx0, y0+ry0, x0+rx1, y0+ry1, fill)
+            else:
+                payload = np.ascontiguousarray(frame[ry0:ry1+1, rx0:rx1+1])
+                self.write_window(x0+rx0, y0+ry0, x0+rx1, y0+ry1, payload)
+        shadow[...] = frame
+        if self._shadow_unknown is not None:
+            self._shadow_unknown[y0:y1+1, x0:x1+1] = False
+            if not self._shadow_unknown.any():
+                self._shadow_unknown = None
 
 
     def clear(self, color=(0,0,0)):
         """
-        Clear the image buffer to the specified RGB color (default black).
-        USE (r, g, b) NOTATION FOR THE COLOUR !!
+        Clear the image buffer and the screen to the specified color (default black).
         """
-
-        if type(color) != type((0,0,0)):
-            print("clear() function colours must be in (255,255,0) form")
-            exit()
-        width, height = Buffer.size
-        Buffer.putdata([color]*(width*height))
-        self.display()
+        width, height = self.buffer.size
+        self.buffer.paste(ImageColor.getrgb(color) if isinstance(color, str) else color, (0, 0, width, height))
+        self.fill_rect(0, 0, self.width-1, self.height-1, color)
 
     def draw(self):
         """Return a PIL ImageDraw instance for drawing on the image buffer."""
-        d = ImageDraw.Draw(Buffer)
-        # Add custom methods to the draw object:
-        d.textrotated = MethodType(_textrotated, d, ImageDraw.Draw)
-        d.pasteimage = MethodType(_pasteimage, d, ImageDraw.Draw)
-        d.textwrapped = MethodType(_textwrapped, d, ImageDraw.Draw)
+        d = ImageDraw.Draw(self.buffer)
+        # Add custom methods to the draw object; they paste into this TFT's canvas
+        d.canvas = self.buffer
+        d.textrotated = MethodType(_textrotated, d)
+        d.pasteimage = MethodType(_pasteimage, d)
+        d.textwrapped = MethodType(_textwrapped, d)
         return d
 
     def load_wallpaper(self, filename):
         # The image should be 320x240 or 240x320 only (full wallpaper!). Errors otherwise.
-        # We need to cope with whatever orientations file image and TFT canvas are.
+        # We need to cope with whatever orientations file image and TFT canvas are;
+        # it is only turned when they differ.
         image = Image.open(filename)
-        if image.size[0] > Buffer.size[0]:
-            Buffer.paste(image.rotate(90))
-        elif image.size[0] < Buffer.size[0]:
-            Buffer.paste(image.rotate(-90))
+        if image.size[0] > self.buffer.size[0]:
+            # landscape image, portrait canvas
+            self.buffer.paste(image.transpose(Image.ROTATE_90))
+        elif image.size[0] < self.buffer.size[0]:
+            # portrait image, landscape canvas (see portrait_to_landscape)
+            self.buffer.paste(image.transpose(Image.ROTATE_270))
         else:
-            Buffer.paste(image)
+            self.buffer.paste(image)
 
     def backup_buffer(self):
-        self.buffer2.paste(Buffer)
+        self.buffer2.paste(self.buffer)
 
     def restore_buffer(self):
-        Buffer.paste(self.buffer2)
+        self.buffer.paste(self.buffer2)
+
+    # Hardware vertical scrolling. Lines are panel rows (portrait y), whatever the
+    # orientation. The drawing calls keep addressing panel memory, so while scrolled,
+    # memory row y is not screen row y.
+
+    def define_scroll_area(self, top_fixed, scroll_height, bottom_fixed):
+        """Split the panel into a fixed top band, a scrolling area and a fixed bottom band (VSCRDEF)."""
+        if top_fixed + scroll_height + bottom_fixed != ILI9341_TFTHEIGHT:
+            raise ValueError("scroll area must add up to {} lines".format(ILI9341_TFTHEIGHT))
+        if self._scroll_area != (top_fixed, scroll_height, bottom_fixed):
+            self.submit([(False, bytes((ILI9341_VSCRDEF,))),
+                         (True, bytes((top_fixed >> 8, top_fixed & 0xFF,
+                                       scroll_height >> 8, scroll_height & 0xFF,
+                                       bottom_fixed >> 8, bottom_fixed & 0xFF)))])
+            self._scroll_area = (top_fixed, scroll_height, bottom_fixed)
+
+    def scroll_to(self, line):
+        """Show memory line "line" at the top of the scrolling area (VSCRSADD)."""
+        if line != self._scroll_start:
+            self.submit([(False, bytes((ILI9341_VSCRSADD,))), (True, bytes((line >> 8, line & 0xFF)))])
+            self._scroll_start = line
+
+    def reset_scroll(self):
+        """Back to an unscrolled full screen, where memory rows and screen rows match again."""
+        self.define_scroll_area(0, ILI9341_TFTHEIGHT, 0)
+        self.scroll_to(0)
 
     def invert(self, onoff):
         if onoff:
@@ -427,13 +781,30 @@ class TFT24T():
             self._gpio.output(self._led, onoff)
 
     def image_to_data(self, image):
-        """Generator function to convert a PIL image to 16-bit 565 RGB bytes."""
-        #NumPy is much faster at doing this. NumPy code provided by:
-        #Keith (https://www.blogger.com/profile/02555547344016007163)
-        pb = np.array(image.convert('RGB')).astype('uint16')
-        color = ((pb[:,:,0] & 0xF8) << 8) | ((pb[:,:,1] & 0xFC) << 3) | (pb[:,:,2] >> 3)
-        return np.dstack(((color >> 8) & 0xFF, color & 0xFF)).flatten().tolist()
+        """Convert a PIL image to a contiguous big-endian 16-bit 565 RGB buffer.
 
+        Returns a memoryview of bytes ready for send2lcd(). The view aliases an
+        output array that is reused for every image of the same size, so it is
+        only valid until the next conversion of that size.
+        """
+        return memoryview(self._image_to_array(image)).cast('B')
+
+    def _image_to_array(self, image):
+        # Same conversion, returned as a (height, width) uint16 array in wire byte order
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        pb = np.asarray(image)
+        color, scratch = self._rgb565_buffers(pb.shape[0], pb.shape[1])
+        return rgb_to_565(pb, color, scratch)
+
+    def _rgb565_buffers(self, height, width):
+        # Preallocated output/scratch arrays, one pair per image size
+        buffers = self._rgb565_cache.get((height, width))
+        if buffers is None:
+            buffers = (np.empty((height, width), dtype=np.uint16),
+                       np.empty((height, width), dtype=np.uint16))
+            self._rgb565_cache[(height, width)] = buffers
+        return buffers
 
     def textdirect(self, pos, text, font, fill="white"):
 
@@ -443,11 +814,8 @@ class TFT24T():
         # Render the text.
         textdraw = ImageDraw.Draw(textimage)
         textdraw.text((0,0), text, font=font, fill=fill)
-        self.set_frame(pos[0], pos[1], pos[0]+width-1, pos[1]+height-1)
-        # Convert image to array of 16bit 565 RGB data bytes.
-        pixelbytes = list(self.image_to_data(textimage))
-        # Write data to hardware.
-        self.data(pixelbytes)
+        # Convert to 16bit 565 RGB and write whatever changed to hardware.
+        self._blit(self._image_to_array(textimage), pos[0], pos[1])
 
     def penOnHotspot(self, HSlist, pos):
         # HotSpot list of "hotspots" - of form   [(x0,y0,x1,y1,returnvalue)]*numOfSpots
@@ -480,11 +848,11 @@ def _textrotated(self, position, text, angle, font, fill="white"):
     # Rotate the text image.
     rotated = textimage.rotate(angle, expand=1)
     # Paste the text into the TFT canvas image, using text itself as a mask for transparency.
-    Buffer.paste(rotated, position, rotated)  # into the global Buffer
+    self.canvas.paste(rotated, position, rotated)  # into the TFT's canvas
     #   example:  draw.textrotated(position, text, angle, font, fill)
 
 def _pasteimage(self, filename, position):
-    Buffer.paste(Image.open(filename), position)
+    self.canvas.paste(Image.open(filename), position)
     # example: draw.pasteimage('bl.jpg', (30,80))
 
 def _textwrapped(self, position, text1, length, height, font, fill="white"):
@@ -0,0 +1,83 @@
+# Several TFT panels in one process, each with its own pages.
+# Panels on the same SPI bus share the controller and are drawn one after the
+# other; panels on different buses (SPI0, and SPI3-6 on a Pi 4) are drawn at the
+# same time by one worker thread per bus, so a refresh of all panels takes about
+# as long as the busiest bus rather than the sum of all panels.
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Panel:
+    """A TFT24T, the pins it is wired to and the pages (Display objects) it shows."""
+
+    def __init__(self, TFT, pages, bus=0, ce=0, dc=None, rst=None, led=None, spi_speed=32000000):
+        self.tft = TFT
+        self.pages = pages
+        self.bus = bus
+        self.ce = ce
+        self.dc = dc
+        self.rst = rst
+        self.led = led
+        self.spi_speed = spi_speed
+        self.active = 0
+
+    @property
+    def page(self):
+        return self.pages[self.active]
+
+    def start(self, async_spi=False):
+        self.tft.initLCD(self.dc, self.rst, self.led, ce=self.ce, spi_speed=self.spi_speed, bus=self.bus)
+        if async_spi:
+            self.tft.start_writer()
+
+    def draw(self):
+        self.page.draw(self.tft)
+
+    def show(self, step):
+        """Move "step" pages on (negative goes back). The new page redraws completely."""
+        self.page.release(self.tft)
+        self.active = (self.active + step) % len(self.pages)
+        self.page.invalidate()
+
+    def close(self):
+        self.tft.backlite(False)
+        self.tft.command(0x28)      # Display off
+        # Closing stops the SPI writer, which flushes everything still queued
+        self.tft.close()
+
+
+class PanelScheduler:
+    """Draws every panel on refresh(), one worker thread per SPI bus."""
+
+    def __init__(self, panels):
+        self.panels = panels
+        self._buses = {}
+        for panel in panels:
+            self._buses.setdefault(panel.bus, []).append(panel)
+        self._executor = None
+        if len(self._buses) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=len(self._buses), thread_name_prefix="spi-bus")
+
+    def _draw_bus(self, panels):
+        for panel in panels:
+            try:
+                panel.draw()
+                # Done when the frame is on the glass, also with the background writer
+                panel.tft.flush()
+            except Exception as ex:
+                print("An exception ocurred while drawing panel on SPI{}.{}".format(panel.bus, panel.ce), ex)
+
+    def refresh(self):
+        """Draw the active page of every panel and wait until all of them are sent."""
+        if self._executor is None:
+            for panels in self._buses.values():
+                self._draw_bus(panels)
+            return
+        jobs = [self._executor.submit(self._draw_bus, panels) for panels in self._buses.values()]
+        for job in jobs:
+            job.result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,217 @@
+# When to call the onecall API, and which parts of the response to ask for.
+# Each dataset (current conditions, hourly and daily forecast) has its own refresh
+# interval, starting at its freshness target. A call asks for the datasets that are due
+# and for those that would fall due before the next call anyway: a call costs one unit
+# of quota whatever it contains, but the parts left out are neither downloaded nor parsed.
+# When a dataset comes back unchanged its interval grows by BACKOFF_FACTOR, up to
+# MAX_BACKOFF times its target, and it drops back to the target as soon as it changes.
+# Calls are also spaced so that the key's daily quota, shared by every location, lasts
+# until it resets at midnight UTC. Only calls that reached the server count against it; after
+# a failure the retries back off, and further still after a 429 (too many requests).
+# The count is kept on disk, so restarting the app does not start the day's quota over.
+
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+DATASETS = ("current", "hourly", "daily")
+# Parts of the onecall response that no page shows
+ALWAYS_EXCLUDED = ("minutely", "alerts")
+
+# Seconds between refreshes while the data keeps changing
+FRESHNESS_TARGETS = {"current": 120, "hourly": 15 * 60, "daily": 3 * 60 * 60}
+BACKOFF_FACTOR = 1.5
+MAX_BACKOFF = 4
+# Seconds before trying again after a failed call, doubling with each failure in a row
+RETRY_DELAY = 15
+# ... and after a 429 answer
+RATE_LIMIT_RETRY = 5 * 60
+MAX_RETRY_DELAY = 60 * 60
+# Data older than this many intervals is shown as stale
+STALE_INTERVALS = 2
+
+# onecall calls per day allowed on the API key, and how many to leave for anything else
+DAILY_QUOTA = 1000
+QUOTA_RESERVE = 50
+
+resources_path = Path(__file__).resolve().parents[1].joinpath("resources")
+BUDGET_PATH = resources_path.joinpath("call_budget.json")
+
+
+class CallBudget:
+    """The calls made on the API key today (UTC), shared by the schedules of every location."""
+
+    def __init__(self, quota=DAILY_QUOTA, reserve=QUOTA_RESERVE, path=None):
+        self.quota = quota
+        self.reserve = reserve
+        # Where the count is kept across restarts (None: not kept)
+        self.path = path
+        self._consumers = 0
+        self._day = None
+        self._used = 0
+        self._lock = threading.Lock()
+        if path is not None and Path(path).exists():
+            self.load()
+
+    def _roll(self, now):
+        # With the lock held: the count starts again on a new day
+        day = int(now // 86400)
+        if day != self._day:
+            self._day = day
+            self._used = 0
+
+    def add_consumer(self):
+        with self._lock:
+            self._consumers += 1
+
+    def used(self):
+        with self._lock:
+            self._roll(time.time())
+            return self._used
+
+    def record_call(self):
+        with self._lock:
+            self._roll(time.time())
+            self._used += 1
+            if self.path is not None:
+                self.save()
+
+    def save(self):
+        # With the lock held. Write next to the file and rename, so a crash never leaves half a file
+        path = Path(self.path)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"day": self._day, "used": self._used}, f)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, str(path))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as ex:
+            print("Could not save the call budget: ", ex)
+
+    def load(self):
+        """Take today's count from the file; a count from an earlier day is ignored."""
+        try:
+            with open(str(self.path)) as f:
+                saved = json.load(f)
+            day, used = int(saved["day"]), int(saved["used"])
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            print("No call budget loaded: ", ex)
+            return
+        with self._lock:
+            self._roll(time.time())
+            if day == self._day:
+                self._used = max(self._used, used)
+
+    def _remaining(self, now):
+        # With the lock held: calls left today, and seconds until the quota resets
+        self._roll(now)
+        return self.quota - self.reserve - self._used, (self._day + 1) * 86400 - now
+
+    def blocked_for(self):
+        """Seconds until calls may be made again, 0 unless today's quota is used up."""
+        with self._lock:
+            remaining, left = self._remaining(time.time())
+        return left if remaining <= 0 else 0
+
+    def spacing(self):
+        """Seconds each consumer should leave between calls for the quota to last the day."""
+        with self._lock:
+            remaining, left = self._remaining(time.time())
+            consumers = max(self._consumers, 1)
+        if remaining <= 0:
+            return left
+        return left * consumers / remaining
+
+
+class RefreshSchedule:
+    """Refresh intervals of one location's datasets, kept within a CallBudget.
+
+    "ages" arguments map each dataset to the seconds since it was requested, None if missing.
+    """
+
+    def __init__(self, budget=None, targets=FRESHNESS_TARGETS, retry=RETRY_DELAY):
+        self.budget = call_budget() if budget is None else budget
+        self.budget.add_consumer()
+        self.targets = dict(targets)
+        self.intervals = dict(targets)
+        self.retry = retry
+        self._last_call = None      # time.monotonic() of the last call
+        self._failures = 0          # failed calls since the last good one
+        self._retry_delay = 0       # seconds from the last call to the next, after a failure
+
+    def next_call(self, ages, force=False):
+        """Seconds until the next call should be made, 0 if it is due now.
+
+        force: call now, whatever the ages and the quota spacing (a failed call is still retried later).
+        """
+        due = 0 if force else min(0 if age is None else self.intervals[name] - age
+                                  for name, age in ages.items())
+        # Nothing at all once today's quota is used up
+        due = max(due, self.budget.blocked_for())
+        if self._last_call is None:
+            return max(due, 0)
+        if self._failures:
+            gap = max(self._retry_delay, self.budget.spacing())
+        elif force:
+            gap = 0
+        else:
+            gap = self.budget.spacing()
+        return max(due, self._last_call + gap - time.monotonic(), 0)
+
+    def plan(self, ages):
+        """The datasets to ask for in a call made now."""
+        # The next call is at least this far away
+        horizon = max(min(self.intervals.values()), self.budget.spacing())
+        return [name for name in DATASETS
+                if ages[name] is None or ages[name] + horizon >= self.intervals[name]]
+
+    def exclude(self, datasets):
+        """The onecall "exclude" parameter for a call asking for datasets."""
+        return ",".join(ALWAYS_EXCLUDED + tuple(name for name in DATASETS if name not in datasets))
+
+    def record_call(self, sent, ok, status=None):
+        """Count a call. sent: it reached the server (so it counts against the quota).
+
+        status: the HTTP status, None if no answer came back.
+        """
+        if sent:
+            self.budget.record_call()
+        self._last_call = time.monotonic()
+        if ok:
+            self._failures = 0
+            return
+        self._failures += 1
+        retry = RATE_LIMIT_RETRY if status == 429 else self.retry
+        self._retry_delay = min(retry * 2 ** (self._failures - 1), MAX_RETRY_DELAY)
+
+    def record_result(self, datasets, changed):
+        """Adapt the intervals of the datasets a call returned; changed: those that differed."""
+        for name in datasets:
+            if name in changed:
+                self.intervals[name] = self.targets[name]
+            else:
+                self.intervals[name] = min(self.intervals[name] * BACKOFF_FACTOR,
+                                           self.targets[name] * MAX_BACKOFF)
+
+    def is_stale(self, ages):
+        return any(age is None or age >= STALE_INTERVALS * self.intervals[name]
+                   for name, age in ages.items())
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+def call_budget():
+    """Return the CallBudget of the API key."""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = CallBudget(path=BUDGET_PATH)
+        return _budget
@@ -0,0 +1,77 @@
+# Indoor temperature, humidity and pressure from the BME280, sampled in the background.
+# Every "interval" seconds the poller thread makes one forced-mode measurement (the sensor
+# sleeps in between) with the chosen oversampling, and publishes it as one Reading by
+# swapping a reference. The pages read that Reading: temperature and humidity always come
+# from the same measurement, and drawing never waits for the I2C bus. Every Reading is
+# also added to a SensorHistory (see sensor_history.py) for charts.
+
+import threading
+import time
+from collections import namedtuple
+
+from . import utils
+from .sensor_history import SensorHistory
+
+# Seconds between measurements
+SENSOR_INTERVAL = 10
+# bme280.oversampling setting for all three measurements; more is less noisy but slower
+SENSOR_OVERSAMPLING = "x4"
+
+# timestamp is time.time() of the measurement
+Reading = namedtuple("Reading", "temperature humidity pressure timestamp")
+
+
+class RoomSensor(threading.Thread):
+    """Polls the BME280. Call start() to begin and stop() to end; reading has the latest values."""
+
+    def __init__(self, interval=SENSOR_INTERVAL, oversampling=SENSOR_OVERSAMPLING):
+        super().__init__(name="room-sensor", daemon=True)
+        self.interval = interval
+        self.oversampling = oversampling
+        self._reading = None
+        # Every reading so far, downsampled, in constant memory
+        self.history = SensorHistory()
+        self._stop_event = threading.Event()
+
+    @property
+    def reading(self):
+        """The latest Reading, None before the first one. No I2C access."""
+        return self._reading
+
+    def sample(self):
+        """Measure now and publish the result. Returns the new Reading, None if the sensor failed."""
+        try:
+            data = utils.bme280_sample(self.oversampling)
+        except Exception as ex:
+            print("Exception while reading the BME280: ", ex)
+            return None
+        reading = Reading(data.temperature, data.humidity, data.pressure, time.time())
+        self._reading = reading
+        self.history.add(reading)
+        return reading
+
+    def start(self):
+        # The first frame already has a reading
+        self.sample()
+        super().start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+
+_sensor = None
+_sensor_lock = threading.Lock()
+
+def room_sensor():
+    """Return the shared RoomSensor (not started)."""
+    global _sensor
+    with _sensor_lock:
+        if _sensor is None:
+            _sensor = RoomSensor()
+        return _sensor
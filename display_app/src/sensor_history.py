@@ -0,0 +1,133 @@
+# Indoor sensor history in a fixed amount of memory.
+# Each resolution (per second, per minute, per hour) is a ring of time buckets in NumPy
+# arrays: the bucket number, the sample count, and the min, max and sum of temperature,
+# humidity and pressure. A bucket's slot in the ring follows from its number, so adding a
+# reading updates one slot per resolution in place (downsampling as it goes, with no
+# separate roll-up step), and a slot still holding an older bucket is simply overwritten.
+# Each chart query (span, number of points) listed in the views also has a ring of its
+# own, one bucket per point, so that query reads exactly "points" buckets. Any other
+# query picks the resolution that fits the span and number of points asked for and
+# reduces the buckets in that span with NumPy, without a Python object per sample.
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+FIELDS = ("temperature", "humidity", "pressure")
+
+# (seconds per bucket, buckets kept): an hour of seconds, two days of minutes, a year of hours
+RESOLUTIONS = ((1, 3600), (60, 2 * 24 * 60), (3600, 365 * 24))
+# (span in seconds, points) of the charts: the last 24 hours in 240 points
+CHART_VIEWS = ((24 * 3600, 240),)
+
+# Start time (seconds since the epoch) of each point; NaN where there was no reading
+Series = namedtuple("Series", "times min max mean")
+
+
+class _Ring:
+    __slots__ = ("step", "size", "bucket", "count", "min", "max", "sum")
+
+    def __init__(self, step, size):
+        self.step = step
+        self.size = size
+        self.bucket = np.full(size, -1, dtype=np.int64)
+        self.count = np.zeros(size, dtype=np.int32)
+        self.min = np.zeros((size, len(FIELDS)), dtype=np.float32)
+        self.max = np.zeros((size, len(FIELDS)), dtype=np.float32)
+        self.sum = np.zeros((size, len(FIELDS)), dtype=np.float64)
+
+    def add(self, timestamp, values):
+        bucket = int(timestamp // self.step)
+        slot = bucket % self.size
+        if self.bucket[slot] == bucket:
+            self.count[slot] += 1
+            np.minimum(self.min[slot], values, out=self.min[slot])
+            np.maximum(self.max[slot], values, out=self.max[slot])
+            self.sum[slot] += values
+        elif self.bucket[slot] < bucket:
+            # A new bucket in the place of one that has gone round the ring
+            self.bucket[slot] = bucket
+            self.count[slot] = 1
+            self.min[slot] = values
+            self.max[slot] = values
+            self.sum[slot] = values
+        # else: older than what the ring holds there (the clock went back); dropped
+
+
+class SensorHistory:
+    """Temperature, humidity and pressure history at several resolutions, in constant memory."""
+
+    def __init__(self, resolutions=RESOLUTIONS, views=CHART_VIEWS):
+        self._rings = [_Ring(step, size) for step, size in sorted(resolutions)]
+        # (span, points) -> ring with a bucket per point
+        self._views = {(span, points): _Ring(span / points, points) for span, points in views}
+        self._lock = threading.Lock()
+
+    def add(self, reading):
+        """Add a room_sensor.Reading."""
+        values = np.array([getattr(reading, name) for name in FIELDS], dtype=np.float64)
+        with self._lock:
+            for ring in self._rings:
+                ring.add(reading.timestamp, values)
+            for ring in self._views.values():
+                ring.add(reading.timestamp, values)
+
+    def _ring_for(self, span, points):
+        # The coarsest resolution whose buckets are no wider than a point, among
+        # those that reach back over the whole span
+        covering = [ring for ring in self._rings if ring.step * ring.size >= span] or self._rings[-1:]
+        fitting = [ring for ring in covering if ring.step <= span / points]
+        return fitting[-1] if fitting else covering[0]
+
+    def series(self, field, span, points, now=None):
+        """The last "span" seconds of field ("temperature", "humidity" or "pressure") as a Series.
+
+        There are "points" points (fewer if the finest resolution has fewer buckets in the
+        span), each with the min, max and mean of the readings in its time range. For one
+        of the views the work is proportional to points; otherwise it is proportional to
+        the number of buckets in the span at the chosen resolution.
+        """
+        column = FIELDS.index(field)
+        now = time.time() if now is None else now
+        ring = self._views.get((span, points)) or self._ring_for(span, points)
+        last = int(now // ring.step)
+        count = max(min(int(span // ring.step), ring.size), 1)
+        points = max(min(points, count), 1)
+        buckets = np.arange(last - count + 1, last + 1, dtype=np.int64)
+        slots = buckets % ring.size
+        with self._lock:
+            valid = ring.bucket[slots] == buckets
+            mins = np.where(valid, ring.min[slots, column], np.inf)
+            maxs = np.where(valid, ring.max[slots, column], -np.inf)
+            sums = np.where(valid, ring.sum[slots, column], 0.0)
+            counts = np.where(valid, ring.count[slots], 0)
+
+        if count == points:
+            # A bucket per point: nothing to reduce
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = sums / counts
+            empty = counts == 0
+            mins[empty] = np.nan
+            maxs[empty] = np.nan
+            mean[empty] = np.nan
+            return Series((buckets * ring.step).astype(np.float64), mins, maxs, mean)
+
+        # Buckets per point differ by at most one when they do not divide evenly
+        starts = (np.arange(points, dtype=np.int64) * count) // points
+        n = np.add.reduceat(counts, starts)
+        empty = n == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.add.reduceat(sums, starts) / n
+        low = np.minimum.reduceat(mins, starts)
+        high = np.maximum.reduceat(maxs, starts)
+        low[empty] = np.nan
+        high[empty] = np.nan
+        mean[empty] = np.nan
+        return Series((buckets[starts] * ring.step).astype(np.float64), low, high, mean)
+
+    def nbytes(self):
+        """Memory held by the arrays, which never grows."""
+        return sum(ring.bucket.nbytes + ring.count.nbytes + ring.min.nbytes + ring.max.nbytes + ring.sum.nbytes
+                   for ring in self._rings + list(self._views.values()))
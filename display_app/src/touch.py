@@ -0,0 +1,141 @@
+# Touch engine for the ADS7843 controller on the TFT.
+# A background thread wakes up on the T_IRQ falling edge, burst-samples the pen
+# position while it stays down and turns the track into tap, swipe and long-press
+# events on a queue. Taps and long-presses are hit-tested against a grid of hotspots.
+
+import queue
+import threading
+import time
+from collections import namedtuple
+
+# Event kinds
+TAP = "tap"
+LONG_PRESS = "long_press"
+SWIPE_LEFT = "swipe_left"
+SWIPE_RIGHT = "swipe_right"
+SWIPE_UP = "swipe_up"
+SWIPE_DOWN = "swipe_down"
+
+# x, y is where the touch started; hotspot is the value of the hotspot under it (or None)
+TouchEvent = namedtuple("TouchEvent", "kind x y hotspot timestamp")
+
+
+class HotspotGrid:
+    """Spatial index of rectangular hotspots. Lookups only check hotspots in one grid cell."""
+
+    def __init__(self, width=240, height=320, cell=40):
+        self._cell = cell
+        self._columns = (width + cell - 1) // cell
+        self._rows = (height + cell - 1) // cell
+        self.clear()
+
+    @classmethod
+    def from_list(cls, hotspots, width=240, height=320, cell=40):
+        # hotspots in the TFT24T.penOnHotspot form: [(x0, y0, x1, y1, value), ...]
+        grid = cls(width, height, cell)
+        for hotspot in hotspots:
+            grid.add(*hotspot)
+        return grid
+
+    def clear(self):
+        self._cells = [[] for _ in range(self._columns * self._rows)]
+
+    def add(self, x0, y0, x1, y1, value):
+        # Inclusive box, as in penOnHotspot. Earlier hotspots win where boxes overlap.
+        hotspot = (x0, y0, x1, y1, value)
+        for row in range(max(int(y0) // self._cell, 0), min(int(y1) // self._cell, self._rows - 1) + 1):
+            for column in range(max(int(x0) // self._cell, 0), min(int(x1) // self._cell, self._columns - 1) + 1):
+                self._cells[row * self._columns + column].append(hotspot)
+
+    def hit(self, x, y):
+        column = int(x) // self._cell
+        row = int(y) // self._cell
+        if not (0 <= column < self._columns and 0 <= row < self._rows):
+            return None
+        for x0, y0, x1, y1, value in self._cells[row * self._columns + column]:
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                return value
+        return None
+
+
+class TouchEngine(threading.Thread):
+    """Turns pen activity into TouchEvents on self.events.
+
+    TFT must have been set up with initTOUCH(). Call start() to begin and stop() to end.
+    """
+
+    def __init__(self, TFT, hotspots=None, samples=8, interval=0.01,
+                 swipe_distance=40, tap_slop=15, long_press_time=0.6):
+        super().__init__(name="touch-engine", daemon=True)
+        self._tft = TFT
+        if hotspots is None:
+            hotspots = HotspotGrid(TFT.width, TFT.height)
+        self.hotspots = hotspots
+        self.events = queue.Queue()
+        self._samples = samples
+        self._interval = interval
+        self._swipe_distance = swipe_distance
+        self._tap_slop = tap_slop
+        self._long_press_time = long_press_time
+        self._irq = threading.Event()
+        self._stop_event = threading.Event()
+
+    def start(self):
+        self._tft.add_pen_callback(self._pen_irq)
+        super().start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._irq.set()
+        self._tft.remove_pen_callback()
+        if self.is_alive():
+            self.join()
+
+    def _pen_irq(self, channel):
+        # Runs in the GPIO library's callback thread; just wake the engine up
+        self._irq.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            # The timeout also catches a touch whose edge arrived before we were waiting
+            self._irq.wait(0.5)
+            self._irq.clear()
+            if self._stop_event.is_set():
+                break
+            if self._tft.penDown():
+                try:
+                    self._track_touch()
+                except Exception as ex:
+                    print("Exception in touch engine: ", ex)
+
+    def _emit(self, kind, position):
+        x, y = position
+        self.events.put(TouchEvent(kind, x, y, self.hotspots.hit(x, y), time.monotonic()))
+
+    def _track_touch(self):
+        start = None
+        start_time = None
+        done = False        # a swipe or long press has already been reported for this touch
+        while self._tft.penDown() and not self._stop_event.is_set():
+            position = self._tft.penPosition(self._samples)
+            now = time.monotonic()
+            if position != [0, 0]:
+                if start is None:
+                    start = position
+                    start_time = now
+                dx = position[0] - start[0]
+                dy = position[1] - start[1]
+                if not done and max(abs(dx), abs(dy)) >= self._swipe_distance:
+                    # Report the swipe as soon as it is unambiguous, not on release
+                    if abs(dx) >= abs(dy):
+                        self._emit(SWIPE_RIGHT if dx > 0 else SWIPE_LEFT, start)
+                    else:
+                        self._emit(SWIPE_DOWN if dy > 0 else SWIPE_UP, start)
+                    done = True
+                elif (not done and now - start_time >= self._long_press_time
+                        and max(abs(dx), abs(dy)) <= self._tap_slop):
+                    self._emit(LONG_PRESS, start)
+                    done = True
+            time.sleep(self._interval)
+        if start is not None and not done:
+            self._emit(TAP, start)
@@ -1,52 +1,77 @@
-import requests         # for openweathermap request
-import smbus2
-import bme280
+import os
+
+from .hal import backend
+from .http_client import http_client, redact   # pooled keep-alive session for openweathermap requests
 
 port = 1
 address = 0x76
-bus = smbus2.SMBus(port)
-
-calibration_params = bme280.load_calibration_params(bus, address)
+# The I2C bus is opened on first use, so importing this module needs no hardware
+bus = None
+calibration_params = None
 
 api_key = "b47b119999470d6b5795aee31bcfa833"
+# The API, or a stand-in such as benchmarks/owm_server.py
+OWM_BASE_URL = os.environ.get("OWM_BASE_URL", "https://api.openweathermap.org/data/2.5").rstrip("/")
+
+def _bme280():
+    global bus, calibration_params
+    hw = backend()
+    if bus is None:
+        bus = hw.smbus2.SMBus(port)
+        calibration_params = hw.bme280.load_calibration_params(bus, address)
+    return hw.bme280
+
+def bme280_sample(oversampling=None):
+    """One forced-mode measurement of temperature, humidity and pressure.
 
+    oversampling is the name of a bme280.oversampling setting ("x1" .. "x16"), default x1.
+    """
+    sensor = _bme280()
+    if oversampling is None:
+        return sensor.sample(bus, address, calibration_params)
+    return sensor.sample(bus, address, calibration_params, getattr(sensor.oversampling, oversampling))
+
+# Each of these makes a measurement of its own; room_sensor() shares one between them
 def bme280_get_temperature():
-    data = bme280.sample(bus, address, calibration_params)
+    data = bme280_sample()
     return data.temperature
 
 def bme280_get_humidity():
-    data = bme280.sample(bus, address, calibration_params)
+    data = bme280_sample()
     return data.humidity
 
-# Blagoevgrad: 42.017, 23.100
+# Sites the panels can show (lat, lon), by name
+LOCATIONS = {
+    "derry": (54.9981, -7.3093),
+    "blagoevgrad": (42.017, 23.100),
+}
+DEFAULT_LOCATION = "derry"
 
-def get_weather_data(lat=54.9981, lon=-7.3093, exclude="minutely,daily"):
+def get_weather_data(lat=54.9981, lon=-7.3093, exclude="minutely,daily", conditional=False):
     """
-    Returns the json object with data from openweathermap.org.
+    Returns the response from openweathermap.org as an http_client.JSONResponse,
+    None if the request never reached the server (so it does not count against the quota).
     Excludes minutely and daily forecasts by default.
+    conditional: answer 304 if nothing changed since the last response to the same request.
     """
-    url = "https://api.openweathermap.org/data/2.5/onecall?lat={}&lon={}&exclude={}&units=metric&appid={}".format(lat, lon, exclude, api_key)
+    url = "{}/onecall?lat={}&lon={}&exclude={}&units=metric&appid={}".format(OWM_BASE_URL, lat, lon, exclude, api_key)
     
     try:
-        response = requests.get(url)            # get response
-        status_code = response.status_code
-
-        if status_code == 200:  
-            return response.json()
-        else:
-            return None
+        return http_client().get_json(url, conditional)
     except Exception as ex:
-        print("Exception in get_weather_data: ", ex)
+        print("Exception in get_weather_data: ", redact(str(ex)))
         return None
 
     
 def validate_weather_data(weather):
-    if weather is not None and not "cod" in weather and "current" in weather:
+    # A response may leave out some of current/hourly/daily (see refresh_schedule.py)
+    if weather is not None and not "cod" in weather and ("current" in weather or "hourly" in weather or "daily" in weather):
         return  True
     else:
         return False
         
 
 if __name__ == "__main__": 
-    data = get_weather_data()
-    print(data)
\ No newline at end of file
+    response = get_weather_data()
+    print(response)
+    print(http_client().last_timing)
\ No newline at end of file
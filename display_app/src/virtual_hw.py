@@ -0,0 +1,342 @@
+# Virtual hardware for running and measuring the display stack without a Raspberry Pi.
+#
+# VirtualHardware bundles stand-ins with the same interfaces the application uses:
+#   gpio    - the parts of RPi.GPIO we call (pins, edges, callbacks)
+#   SpiDev  - a spidev.SpiDev look-alike routed to a device by (bus, chip select)
+#   panel   - an ILI9341 that decodes CASET/PASET/RAMWR/MADCTL/scrolling into a framebuffer,
+#             counts bytes and transactions and models the time spent on the SPI clock
+#   touch   - an ADS7843 touch controller that answers X/Y conversions for a simulated pen
+#   bme280  - the functions of the bme280 module, with a settable simulated reading
+#   smbus2  - SMBus stand-in for the above
+
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+from . import lib_tft24T as tft
+
+# Time spent per spidev ioctl on top of the bits on the wire (syscall, driver, DMA setup)
+SPI_TRANSACTION_OVERHEAD = 0.00002
+
+
+class VirtualGPIO:
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+    PUD_UP = 22
+    PUD_DOWN = 21
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self._levels = {}
+        self._callbacks = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        if direction == self.IN:
+            # Inputs float high (pen not touching, etc.) until a device drives them
+            self._levels.setdefault(pin, self.HIGH)
+        elif initial is not None:
+            self._levels[pin] = initial
+
+    def output(self, pin, value):
+        self._levels[pin] = self.HIGH if value else self.LOW
+
+    def input(self, pin):
+        return self._levels.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self._callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self._callbacks.pop(pin, None)
+
+    def cleanup(self, *args):
+        self._callbacks.clear()
+
+    def drive(self, pin, value):
+        """Set an input pin from the device side, firing edge callbacks like the real library."""
+        old = self._levels.get(pin, self.HIGH)
+        new = self.HIGH if value else self.LOW
+        self._levels[pin] = new
+        if old == new or pin not in self._callbacks:
+            return
+        edge, callback = self._callbacks[pin]
+        rising = new == self.HIGH
+        if callback is not None and (edge == self.BOTH or (edge == self.RISING) == rising):
+            callback(pin)
+
+
+class SPIStats:
+    """Bytes, transactions and modelled wire time for one SPI device."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.bytes = 0
+        self.transactions = 0
+        self.transfer_time = 0.0
+
+    def record(self, nbytes, speed_hz):
+        self.bytes += nbytes
+        self.transactions += 1
+        self.transfer_time += nbytes * 8 / speed_hz + SPI_TRANSACTION_OVERHEAD
+
+    def as_dict(self):
+        return {"bytes": self.bytes, "transactions": self.transactions, "transfer_time": self.transfer_time}
+
+
+class VirtualSpiDev:
+    """spidev.SpiDev look-alike. Subclassed per VirtualHardware so SpiDev() finds its devices."""
+
+    hardware = None
+
+    def __init__(self):
+        self.max_speed_hz = 500000
+        self.mode = 0
+        self._device = None
+
+    def open(self, bus, device):
+        self._device = self.hardware.spi_device(bus, device)
+
+    def close(self):
+        self._device = None
+
+    def writebytes(self, data):
+        self._device.transfer(bytes(data), self.max_speed_hz)
+
+    def writebytes2(self, data):
+        self._device.transfer(bytes(memoryview(data).cast('B')), self.max_speed_hz)
+
+    def xfer(self, data):
+        return self._device.transfer(bytes(data), self.max_speed_hz)
+
+    xfer2 = xfer
+
+
+class VirtualILI9341:
+    """Decodes the 4-wire SPI command stream of an ILI9341 into a 240x320 framebuffer.
+
+    The framebuffer is held in physical portrait orientation, in the wire order 565
+    values TFT24T uses, so it can be compared with TFT24T's shadow directly.
+    """
+
+    def __init__(self, gpio, dc_pin):
+        self._gpio = gpio
+        self._dc_pin = dc_pin
+        self.stats = SPIStats()
+        self.framebuffer = np.zeros((tft.ILI9341_TFTHEIGHT, tft.ILI9341_TFTWIDTH), dtype=np.uint16)
+        self.commands = 0
+        self.madctl = 0x48
+        self.scroll_area = (0, tft.ILI9341_TFTHEIGHT, 0)
+        self.scroll_start = 0
+        self.display_on = False
+        self.sleeping = True
+        self.inverted = False
+        self._command = None
+        self._params = bytearray()
+        self._columns = (0, tft.ILI9341_TFTWIDTH - 1)
+        self._pages = (0, tft.ILI9341_TFTHEIGHT - 1)
+        self._pointer = 0
+        self._odd_byte = b""
+
+    def transfer(self, data, speed_hz):
+        self.stats.record(len(data), speed_hz)
+        if self._gpio.input(self._dc_pin):
+            self._data(data)
+        else:
+            for cmd in data:
+                self._start_command(cmd)
+        return [0] * len(data)
+
+    def _start_command(self, cmd):
+        self.commands += 1
+        self._command = cmd
+        self._params = bytearray()
+        if cmd == tft.ILI9341_RAMWR:
+            self._pointer = 0
+            self._odd_byte = b""
+        elif cmd == tft.ILI9341_SLPOUT:
+            self.sleeping = False
+        elif cmd == tft.ILI9341_SLPIN:
+            self.sleeping = True
+        elif cmd == tft.ILI9341_DISPON:
+            self.display_on = True
+        elif cmd == tft.ILI9341_DISPOFF:
+            self.display_on = False
+        elif cmd == tft.ILI9341_INVON:
+            self.inverted = True
+        elif cmd == tft.ILI9341_INVOFF:
+            self.inverted = False
+        elif cmd == tft.ILI9341_SWRESET:
+            self.madctl = 0x00
+            self.scroll_area = (0, tft.ILI9341_TFTHEIGHT, 0)
+            self.scroll_start = 0
+
+    def _data(self, data):
+        if self._command == tft.ILI9341_RAMWR:
+            self._write_pixels(data)
+            return
+        self._params.extend(data)
+        p = self._params
+        if self._command == tft.ILI9341_CASET and len(p) >= 4:
+            self._columns = ((p[0] << 8) | p[1], (p[2] << 8) | p[3])
+        elif self._command == tft.ILI9341_PASET and len(p) >= 4:
+            self._pages = ((p[0] << 8) | p[1], (p[2] << 8) | p[3])
+        elif self._command == tft.ILI9341_MADCTL and len(p) >= 1:
+            self.madctl = p[0]
+        elif self._command == tft.ILI9341_VSCRDEF and len(p) >= 6:
+            self.scroll_area = ((p[0] << 8) | p[1], (p[2] << 8) | p[3], (p[4] << 8) | p[5])
+        elif self._command == tft.ILI9341_VSCRSADD and len(p) >= 2:
+            self.scroll_start = (p[0] << 8) | p[1]
+
+    def _write_pixels(self, data):
+        data = self._odd_byte + data
+        if len(data) % 2:
+            self._odd_byte = data[-1:]
+            data = data[:-1]
+        else:
+            self._odd_byte = b""
+        if not data:
+            return
+        # Keep the bytes as they came over the wire, i.e. the framebuffer holds wire order values
+        values = np.frombuffer(data, dtype=np.uint16)
+        c0, c1 = self._columns
+        p0, p1 = self._pages
+        width = c1 - c0 + 1
+        size = width * (p1 - p0 + 1)
+        index = (self._pointer + np.arange(values.size)) % size
+        self._pointer = (self._pointer + values.size) % size
+        columns = c0 + index % width
+        pages = p0 + index // width
+        rows, cols = self._to_physical(columns, pages)
+        self.framebuffer[rows, cols] = values
+
+    def _to_physical(self, columns, pages):
+        # Memory address (column, page) -> physical (row, column), with MADCTL 0x48
+        # (the portrait setting of the init table) as the identity mapping.
+        if self.madctl & 0x20:          # MV: exchange rows and columns
+            x, y = pages, columns
+        else:
+            x, y = columns, pages
+        if not self.madctl & 0x40:      # MX clear: columns mirrored relative to 0x48
+            x = (tft.ILI9341_TFTWIDTH - 1) - x
+        if self.madctl & 0x80:          # MY: rows mirrored
+            y = (tft.ILI9341_TFTHEIGHT - 1) - y
+        return y, x
+
+    def screen(self):
+        """What the glass shows: the framebuffer with vertical scrolling applied, as an RGB image."""
+        top, height, bottom = self.scroll_area
+        rows = np.arange(tft.ILI9341_TFTHEIGHT)
+        scrolling = (rows >= top) & (rows < top + height)
+        offset = self.scroll_start - top
+        rows[scrolling] = top + (rows[scrolling] - top + offset) % max(height, 1)
+        pixels = self.framebuffer[rows].byteswap() if np.little_endian else self.framebuffer[rows]
+        rgb = np.empty(pixels.shape + (3,), dtype=np.uint8)
+        rgb[:, :, 0] = (pixels >> 8) & 0xF8
+        rgb[:, :, 1] = (pixels >> 3) & 0xFC
+        rgb[:, :, 2] = (pixels << 3) & 0xF8
+        return Image.fromarray(rgb, "RGB")
+
+
+class VirtualADS7843:
+    """Touch controller: answers 3-byte X/Y conversion frames for the simulated pen position."""
+
+    def __init__(self, gpio, pen_pin):
+        self._gpio = gpio
+        self._pen_pin = pen_pin
+        self.stats = SPIStats()
+        self.raw = None
+
+    def transfer(self, data, speed_hz):
+        self.stats.record(len(data), speed_hz)
+        reply = [0] * len(data)
+        for i in range(0, len(data) - 2, 3):
+            value = 0
+            if self.raw is not None:
+                if data[i] == tft.TFT24T.X:
+                    value = self.raw[0]
+                elif data[i] == tft.TFT24T.Y:
+                    value = self.raw[1]
+            reply[i + 1] = (value >> 5) & 0xFF
+            reply[i + 2] = (value << 3) & 0xFF
+        return reply
+
+    def press(self, x, y):
+        """Put the pen down at portrait screen position x, y (inverse of the TFT24T calibration)."""
+        raw_x = 4096 - (x + tft.calib_offset240) * 4096 / tft.calib_scale240
+        raw_y = (y + tft.calib_offset320) * 4096 / tft.calib_scale320
+        self.raw = (int(round(raw_x)) & 0xFFF, int(round(raw_y)) & 0xFFF)
+        self._gpio.drive(self._pen_pin, self._gpio.LOW)
+
+    def release(self):
+        self.raw = None
+        self._gpio.drive(self._pen_pin, self._gpio.HIGH)
+
+
+class VirtualBME280:
+    """The bme280 module functions used by utils, returning a settable simulated reading."""
+
+    # bme280.oversampling
+    oversampling = SimpleNamespace(x1=1, x2=2, x4=3, x8=4, x16=5)
+
+    def __init__(self, temperature=21.0, humidity=45.0, pressure=1013.25):
+        self.temperature = temperature
+        self.humidity = humidity
+        self.pressure = pressure
+        self.samples = 0
+
+    def load_calibration_params(self, bus, address):
+        return SimpleNamespace(address=address)
+
+    def sample(self, bus, address, compensation_params=None, sampling=None):
+        self.samples += 1
+        return SimpleNamespace(id=self.samples, timestamp=time.time(), temperature=self.temperature,
+                               humidity=self.humidity, pressure=self.pressure)
+
+
+class VirtualSMBus:
+
+    def __init__(self, bus=None):
+        self.bus = bus
+
+    def close(self):
+        pass
+
+
+class VirtualHardware:
+    """One simulated board: GPIO, an ILI9341 on SPI0 CE0, its touch controller on SPI1 CE0 and a BME280."""
+
+    def __init__(self, dc_pin=24, pen_pin=16):
+        self.gpio = VirtualGPIO()
+        self.panel = VirtualILI9341(self.gpio, dc_pin)
+        self.touch = VirtualADS7843(self.gpio, pen_pin)
+        self.bme280 = VirtualBME280()
+        self.smbus2 = SimpleNamespace(SMBus=VirtualSMBus)
+        self._devices = {(0, 0): self.panel, (1, 0): self.touch}
+        self.SpiDev = type("SpiDev", (VirtualSpiDev,), {"hardware": self})
+        self.spidev = SimpleNamespace(SpiDev=self.SpiDev)
+
+    def attach(self, bus, chip_select, device):
+        """Put another device (e.g. a second VirtualILI9341) on the bus."""
+        self._devices[(bus, chip_select)] = device
+
+    def spi_device(self, bus, chip_select):
+        try:
+            return self._devices[(bus, chip_select)]
+        except KeyError:
+            raise FileNotFoundError("No virtual SPI device at /dev/spidev{}.{}".format(bus, chip_select))
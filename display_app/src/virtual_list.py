@@ -0,0 +1,62 @@
+# A list of fixed-height rows scrolled with the ILI9341 hardware vertical scrolling.
+# Only as many rows as fit on the screen live in panel memory, in a ring of slots.
+# Scrolling by one row renders the newly exposed row into the slot that just left
+# the screen and moves the scroll start, instead of redrawing the whole screen.
+# Portrait only: the panel scrolls along its 320 pixel axis.
+
+ILI9341_TFTHEIGHT = 320
+
+
+class VirtualList:
+
+    def __init__(self, render_row, row_height=50, visible_rows=6, top=0, first=0):
+        # render_row(TFT, index, y0) draws list entry "index" with its top edge at memory row y0
+        self._render_row = render_row
+        self.row_height = row_height
+        self.visible_rows = visible_rows
+        self.top = top
+        self.first = first
+        self.count = 0
+
+    @property
+    def _scroll_height(self):
+        return self.row_height * self.visible_rows
+
+    def _slot_y(self, index):
+        # Memory row where the slot holding entry "index" starts
+        return self.top + (index % self.visible_rows) * self.row_height
+
+    def _clamp(self, first):
+        return max(0, min(first, self.count - self.visible_rows))
+
+    def draw(self, TFT):
+        """Render every visible row into its slot. Call apply() once the pixels are on the panel."""
+        self.first = self._clamp(self.first)
+        for index in range(self.first, min(self.first + self.visible_rows, self.count)):
+            self._render_row(TFT, index, self._slot_y(index))
+
+    def apply(self, TFT):
+        """Program the scroll area and start line for the current first row."""
+        TFT.define_scroll_area(self.top, self._scroll_height,
+                               ILI9341_TFTHEIGHT - self.top - self._scroll_height)
+        TFT.scroll_to(self._slot_y(self.first))
+
+    def scroll(self, TFT, rows):
+        """Scroll by "rows" entries (negative scrolls back). Returns the number of rows moved."""
+        target = self._clamp(self.first + rows)
+        moved = target - self.first
+        step = 1 if moved > 0 else -1
+        for _ in range(abs(moved)):
+            if step > 0:
+                # The entry below the screen takes the slot of the one leaving at the top
+                exposed = self.first + self.visible_rows
+            else:
+                exposed = self.first - 1
+            self._render_row(TFT, exposed, self._slot_y(exposed))
+            self.first += step
+            TFT.scroll_to(self._slot_y(self.first))
+        return moved
+
+    def release(self, TFT):
+        """Hand the panel back to normal, unscrolled drawing."""
+        TFT.reset_scroll()
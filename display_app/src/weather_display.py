@@ -5,16 +5,18 @@
 # The file can be run as a standalone for testing. Go outside the infodisplay directory 
 # and issue python3 -m infodisplay.bin.display.weather_display
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageFont
 from pathlib import Path
 from datetime import datetime
 from time import mktime
-import RPi.GPIO as GPIO
-import spidev
 
 from .display import Display
 from .lib_tft24T import TFT24T
-from .utils import bme280_get_humidity, bme280_get_temperature, get_weather_data
+from .hal import backend
+from .icon_pack import icon_pack
+from .glyph_atlas import glyph_atlas, TextField
+from .room_sensor import room_sensor
+from .weather_store import weather_store
 
 
 # Constants for TFT layout
@@ -181,7 +183,13 @@ INSIDE_HUMIDITY_X1 = INSIDE_HUMIDITY_X0 + INSIDE_HUMIDITY_BOX_SIZE[0]
 INSIDE_HUMIDITY_Y1 = INSIDE_HUMIDITY_Y0 + INSIDE_HUMIDITY_BOX_SIZE[1] 
 INSIDE_HUMIDITY_COORDS = (INSIDE_HUMIDITY_X0, INSIDE_HUMIDITY_Y0, INSIDE_HUMIDITY_X1, INSIDE_HUMIDITY_Y1)
 
+# Mark in the top left corner while the weather shown is old (snapshot from disk, failed refresh)
+STALE_MARK_X0 = 2
+STALE_MARK_Y0 = 2
+STALE_MARK_SIZE = 6
+
 pink = (255, 102, 255)
+orange = (255, 140, 0)
 black = (0, 0, 0)
 white = (255, 255, 255)
 yellow = (255, 255, 0)
@@ -192,19 +200,23 @@ light_blue = (191, 253, 255)
 
 class WeatherDisplay(Display):
 
-    def __init__(self, lat=54.9981, lon=-7.3093):
+    def __init__(self, lat=54.9981, lon=-7.3093, store=None):
         self.lat = lat
         self.lon = lon
-        self.weather = get_weather_data(self.lat, self.lon)
+        self._store = weather_store(lat, lon) if store is None else store
+        self.forecast = self._store.forecast
         # Get timestamp in seconds 
         self.time = mktime(datetime.now().timetuple())
         self._has_drawn_display = False
+        # The clock sends only the digits that changed since the last second
+        self._clock = TextField(glyph_atlas(fnt_time), CURRENT_TIME_BOX_SIZE, CURRENT_TIME_X0, CURRENT_TIME_Y0)
+        # The room sensor Reading on screen
+        self._reading = None
+        self._stale_shown = None
 
     def _tft_print_blocktext(self, TFT, text, font, boxsize, coordinates, fill_color='black', font_color='white'):
-        bounding_box = Image.new('RGB', boxsize, fill_color)
-        draw = ImageDraw.Draw(bounding_box)
-        draw.text((0,0), text, font=font, fill=font_color)
-        TFT.display_block(bounding_box, coordinates[0], coordinates[1], coordinates[2]-1, coordinates[3]-1)
+        # Composed from cached glyph tiles; no PIL image is rendered per update
+        glyph_atlas(font, fill_color, font_color).draw(TFT, text, boxsize, coordinates[0], coordinates[1])
 
     def _print_current_date(self, TFT, timestamp):
         current_date = timestamp.strftime("%a %d %b %Y")
@@ -212,141 +224,124 @@ class WeatherDisplay(Display):
 
     def _print_current_time(self, TFT, timestamp):
         current_time = timestamp.strftime("%H:%M:%S")
-        self._tft_print_blocktext(TFT, current_time, fnt_time, CURRENT_TIME_BOX_SIZE, CURRENT_TIME_COORDS)
+        self._clock.draw(TFT, current_time)
 
-    def _print_current_weather(self, TFT, weather):
+    def _print_current_weather(self, TFT, forecast):
         try:
-            temp = weather["current"]["temp"]
-            feels_like = weather["current"]["feels_like"]
-            humidity = weather["current"]["humidity"]
-            description = weather["current"]["weather"][0]["main"]
-            description = description.title()
-            wind_speed = weather["current"]["wind_speed"]
-            icon = weather["current"]["weather"][0]["icon"]
+            current = forecast.current
 
             # Get and display icon for current weather
-            with Image.open(Path(__file__).resolve().parents[1].joinpath("resources/LargeIcons/" + icon + ".bmp")) as current_weather_icon:
-                TFT.display_block(current_weather_icon, CURRENT_WEATHER_ICON_X0,
-                                CURRENT_WEATHER_ICON_Y0, CURRENT_WEATHER_ICON_X1-1, CURRENT_WEATHER_ICON_Y1-1)
+            icon_pack().blit(TFT, "LargeIcons", current.icon_id, CURRENT_WEATHER_ICON_X0, CURRENT_WEATHER_ICON_Y0)
 
             # Display description
-            self._tft_print_blocktext(TFT, description, fnt_desc, WEATHER_DESCRIPTION_BOX_SIZE, WEATHER_DESCRIPTION_COORDS, fill_color='black', font_color='yellow')
+            self._tft_print_blocktext(TFT, current.description, fnt_desc, WEATHER_DESCRIPTION_BOX_SIZE, WEATHER_DESCRIPTION_COORDS, fill_color='black', font_color='yellow')
 
             # Display humidity
-            humidity_string = f"{humidity:<4.1f}%"
-            self._tft_print_blocktext(TFT, humidity_string, fnt_desc, HUMIDITY_BOX_SIZE, HUMIDITY_COORDS, font_color=light_blue)
+            self._tft_print_blocktext(TFT, current.humidity, fnt_desc, HUMIDITY_BOX_SIZE, HUMIDITY_COORDS, font_color=light_blue)
 
             # Display wind speed
-            windspeed_string = f"{wind_speed:<4.2f} m/s"
-            self._tft_print_blocktext(TFT, windspeed_string, fnt_desc, WINDSPEED_BOX_SIZE, WINDSPEED_COORDS)
+            self._tft_print_blocktext(TFT, current.wind_speed, fnt_desc, WINDSPEED_BOX_SIZE, WINDSPEED_COORDS)
 
             # Display current temperature
-            temp_string = f"{temp:<4.1f}\u00b0C"
-            self._tft_print_blocktext(TFT, temp_string, fnt_temp, TEMPERATURE_BOX_SIZE, TEMPERATURE_COORDS)
+            self._tft_print_blocktext(TFT, current.temp, fnt_temp, TEMPERATURE_BOX_SIZE, TEMPERATURE_COORDS)
 
         except Exception as ex:
             print("An exception ocurred while parsing weather", ex)
 
-    def _print_hourly_forecast(self, TFT, weather):
+    def _print_hourly_forecast(self, TFT, forecast):
         try:
             # For 3 hours, get time, temperature, icon, humidity
-            hour_one = weather["hourly"][1]
-            hour_one_time = datetime.utcfromtimestamp(hour_one["dt"]).strftime("%H:%M")
-            hour_one_temp = hour_one["temp"]
-            hour_one_humidity = hour_one["humidity"]
-            hour_one_icon_id = hour_one["weather"][0]["icon"]
-
-            hour_two = weather["hourly"][2]
-            hour_two_time = datetime.utcfromtimestamp(hour_two["dt"]).strftime("%H:%M")
-            hour_two_temp = hour_two["temp"]
-            hour_two_humidity = hour_two["humidity"]
-            hour_two_icon_id = hour_two["weather"][0]["icon"]
-
-            hour_three = weather["hourly"][3]
-            hour_three_time = datetime.utcfromtimestamp(hour_three["dt"]).strftime("%H:%M")
-            hour_three_temp = hour_three["temp"]
-            hour_three_humidity = hour_three["humidity"]
-            hour_three_icon_id = hour_three["weather"][0]["icon"]
-
-            self._tft_print_blocktext(TFT, hour_one_time, fnt_small, HOURLY_TIME_BOX_SIZE, HOURLY_TIME_1_COORDS)
-            self._tft_print_blocktext(TFT, hour_two_time, fnt_small, HOURLY_TIME_BOX_SIZE, HOURLY_TIME_2_COORDS)
-            self._tft_print_blocktext(TFT, hour_three_time, fnt_small, HOURLY_TIME_BOX_SIZE, HOURLY_TIME_3_COORDS)
-
-            h1_temp_string = f"{hour_one_temp:>4.1f}\u00b0C"
-            h2_temp_string = f"{hour_two_temp:>4.1f}\u00b0C"
-            h3_temp_string = f"{hour_three_temp:>4.1f}\u00b0C"
-
-            self._tft_print_blocktext(TFT, h1_temp_string, fnt_small, HOURLY_TEMP_BOX_SIZE, HOURLY_TEMP_1_COORDS)
-            self._tft_print_blocktext(TFT, h2_temp_string, fnt_small, HOURLY_TEMP_BOX_SIZE, HOURLY_TEMP_2_COORDS)
-            self._tft_print_blocktext(TFT, h3_temp_string, fnt_small, HOURLY_TEMP_BOX_SIZE, HOURLY_TEMP_3_COORDS)
-
-            # Path(__file__).resolve().parents[1].joinpath("resources/SmallIcons/" + hour_one_icon_id + ".bmp")
-            with Image.open(Path(__file__).resolve().parents[1].joinpath("resources/SmallIcons/" + hour_one_icon_id + ".bmp")) as hour_one_icon:
-                TFT.display_block(hour_one_icon, HOURLY_ICON_1_X0, HOURLY_ICON_1_Y0, HOURLY_ICON_1_X1-1, HOURLY_ICON_1_Y1-1)
-            
-            with Image.open(Path(__file__).resolve().parents[1].joinpath("resources/SmallIcons/" + hour_two_icon_id + ".bmp")) as hour_two_icon:
-                TFT.display_block(hour_two_icon, HOURLY_ICON_2_X0, HOURLY_ICON_2_Y0, HOURLY_ICON_2_X1-1, HOURLY_ICON_2_Y1-1)
-
-            with Image.open(Path(__file__).resolve().parents[1].joinpath("resources/SmallIcons/" + hour_three_icon_id + ".bmp")) as hour_three_icon:
-                TFT.display_block(hour_three_icon, HOURLY_ICON_3_X0, HOURLY_ICON_3_Y0, HOURLY_ICON_3_X1-1, HOURLY_ICON_3_Y1-1)
-
-            h1_humidity_string = f"{hour_one_humidity:4.1f}%"
-            h2_humidity_string = f"{hour_two_humidity:4.1f}%"
-            h3_humidity_string = f"{hour_three_humidity:4.1f}%"
-
-            self._tft_print_blocktext(TFT, h1_humidity_string, fnt_small, HOURLY_HUMIDITY_BOX_SIZE, HOURLY_HUMIDITY_1_COORDS, font_color=light_blue)
-            self._tft_print_blocktext(TFT, h2_humidity_string, fnt_small, HOURLY_HUMIDITY_BOX_SIZE, HOURLY_HUMIDITY_2_COORDS, font_color=light_blue)
-            self._tft_print_blocktext(TFT, h3_humidity_string, fnt_small, HOURLY_HUMIDITY_BOX_SIZE, HOURLY_HUMIDITY_3_COORDS, font_color=light_blue)
+            hour_one, hour_two, hour_three = forecast.hourly[1:4]
+
+            self._tft_print_blocktext(TFT, hour_one.time, fnt_small, HOURLY_TIME_BOX_SIZE, HOURLY_TIME_1_COORDS)
+            self._tft_print_blocktext(TFT, hour_two.time, fnt_small, HOURLY_TIME_BOX_SIZE, HOURLY_TIME_2_COORDS)
+            self._tft_print_blocktext(TFT, hour_three.time, fnt_small, HOURLY_TIME_BOX_SIZE, HOURLY_TIME_3_COORDS)
+
+            self._tft_print_blocktext(TFT, hour_one.temp, fnt_small, HOURLY_TEMP_BOX_SIZE, HOURLY_TEMP_1_COORDS)
+            self._tft_print_blocktext(TFT, hour_two.temp, fnt_small, HOURLY_TEMP_BOX_SIZE, HOURLY_TEMP_2_COORDS)
+            self._tft_print_blocktext(TFT, hour_three.temp, fnt_small, HOURLY_TEMP_BOX_SIZE, HOURLY_TEMP_3_COORDS)
+
+            icons = icon_pack()
+            icons.blit(TFT, "SmallIcons", hour_one.icon_id, HOURLY_ICON_1_X0, HOURLY_ICON_1_Y0)
+            icons.blit(TFT, "SmallIcons", hour_two.icon_id, HOURLY_ICON_2_X0, HOURLY_ICON_2_Y0)
+            icons.blit(TFT, "SmallIcons", hour_three.icon_id, HOURLY_ICON_3_X0, HOURLY_ICON_3_Y0)
+
+            self._tft_print_blocktext(TFT, hour_one.humidity, fnt_small, HOURLY_HUMIDITY_BOX_SIZE, HOURLY_HUMIDITY_1_COORDS, font_color=light_blue)
+            self._tft_print_blocktext(TFT, hour_two.humidity, fnt_small, HOURLY_HUMIDITY_BOX_SIZE, HOURLY_HUMIDITY_2_COORDS, font_color=light_blue)
+            self._tft_print_blocktext(TFT, hour_three.humidity, fnt_small, HOURLY_HUMIDITY_BOX_SIZE, HOURLY_HUMIDITY_3_COORDS, font_color=light_blue)
 
         except Exception as ex:
             print("An exception ocurred while parsing weather", ex)
 
     def _print_bme280_data(self, TFT):
-        in_temp = bme280_get_temperature()
-        in_himidity = bme280_get_humidity()
-        in_temp_string = f"{in_temp:>4.1f}\u00b0C"
-        in_humidity_string = f"{in_himidity:4.1f}%"
+        # The latest reading of the background poller; no I2C access here
+        reading = room_sensor().reading
+        self._reading = reading
+        if reading is None:
+            return
+        in_temp_string = f"{reading.temperature:>4.1f}\u00b0C"
+        in_humidity_string = f"{reading.humidity:4.1f}%"
         self._tft_print_blocktext(TFT, in_temp_string, fnt_temp_in, INSIDE_TEMP_BOX_SIZE, INSIDE_TEMP_COORDS)
         self._tft_print_blocktext(TFT, in_humidity_string, fnt_temp_in, INSIDE_HUMIDITY_BOX_SIZE, INSIDE_HUMIDITY_COORDS, font_color=light_blue)
 
+    def _print_staleness(self, TFT, force=False):
+        # Only when it changes: the mark is far from the clock, and touching it every
+        # second would make present() compare everything in between
+        stale = self._store.is_stale()
+        if stale == self._stale_shown and not force:
+            return
+        self._stale_shown = stale
+        color = orange if stale else black
+        TFT.fill_rect(STALE_MARK_X0, STALE_MARK_Y0,
+                      STALE_MARK_X0 + STALE_MARK_SIZE - 1, STALE_MARK_Y0 + STALE_MARK_SIZE - 1, color)
 
     def _draw_complete_display(self, TFT):
         now = datetime.now()
 
-        TFT.clear(black)
-        self._print_current_date(TFT, now)
-        self._print_current_time(TFT, now)
-
-        if self.weather is not None:
-            try:
-                weather_timestamp = datetime.utcfromtimestamp(self.weather["current"]["dt"])
-                tdiff = now - weather_timestamp
-                if tdiff.seconds >= 120:
-                    self.weather = get_weather_data(self.lat, self.lon)
-                   
-                # Get weather data and update display
-                self._print_current_weather(TFT, self.weather)
-                self._print_hourly_forecast(TFT, self.weather)
-                self._print_bme280_data(TFT)
-            except Exception as ex:
-                print(ex)      
+        # Compose the whole page, then send only what differs from the panel
+        TFT.begin_frame()
+        try:
+            TFT.clear(black)
+            self._clock.invalidate()
+            self._print_current_date(TFT, now)
+            self._print_current_time(TFT, now)
+
+            self.forecast = self._store.get()
+            if self.forecast is not None:
+                try:
+                    # Update display with the weather data
+                    self._print_current_weather(TFT, self.forecast)
+                    self._print_hourly_forecast(TFT, self.forecast)
+                    self._print_bme280_data(TFT)
+                except Exception as ex:
+                    print(ex)      
+            self._print_staleness(TFT, force=True)
+        finally:
+            TFT.present()
 
     def _update_display(self, TFT):
         now = datetime.now()
-        self._print_current_time(TFT, now)
 
-        if (now.second == 0 and now.minute == 0):
-            self._print_current_date(TFT, now)
-
-        # Get weather data every 2 minutes
-        if (now.second == 0 and now.minute % 2 == 0):
-            self.weather = get_weather_data(self.lat, self.lon)
-            if self.weather is not None:
-                self._print_current_weather(TFT, self.weather)
-                self._print_hourly_forecast(TFT, self.weather)
+        TFT.begin_frame()
+        try:
+            self._print_current_time(TFT, now)
+
+            if (now.second == 0 and now.minute == 0):
+                self._print_current_date(TFT, now)
+
+            # Redraw the weather whenever the store has a new forecast (get() also
+            # starts a fetch when the refresh schedule says one is due)
+            forecast = self._store.get()
+            if forecast is not None and forecast is not self.forecast:
+                self.forecast = forecast
+                self._print_current_weather(TFT, self.forecast)
+                self._print_hourly_forecast(TFT, self.forecast)
+            # Room readings as soon as the sensor has a new one
+            if room_sensor().reading is not self._reading:
                 self._print_bme280_data(TFT)
-            else:
-                print("Could not validate weather data json.", self.weather)
+            self._print_staleness(TFT)
+        finally:
+            TFT.present()
 
     # Draw the complete display
     def draw(self, TFT):
@@ -368,6 +363,8 @@ if __name__ == '__main__':
     print("Fetching weather data and printing it on thr TFT...")
     print("CTRL+C for exit.")
 
+    hw = backend()
+    GPIO = hw.GPIO
     GPIO.setmode(GPIO.BCM)
     GPIO.setwarnings(False)
 
@@ -378,12 +375,13 @@ if __name__ == '__main__':
     LED = 15
 
     # Create TFT LCD/TOUCH object:
-    TFTDisplay = TFT24T(spidev.SpiDev(), GPIO, landscape=False)
+    TFTDisplay = TFT24T(hw.spidev.SpiDev(), GPIO, landscape=False)
     # If landscape=False or omitted, display defaults to portrait mode
 
     # Initialize display.
     TFTDisplay.initLCD(DC, RST, LED)
 
+    room_sensor().start()
     weatherDisplay = WeatherDisplay()
     weatherDisplay.draw(TFTDisplay)
 
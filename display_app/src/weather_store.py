@@ -0,0 +1,318 @@
+# The onecall data of a location, fetched once and shared by all the pages.
+# Fetches follow a RefreshSchedule (see refresh_schedule.py), run on a WeatherRefresher's
+# threads when one is attached, and are parsed once into a Forecast (see forecast.py).
+# The last good response is kept in a gzip snapshot on disk for the next start.
+
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import utils
+from .forecast import Forecast
+from .refresh_schedule import DATASETS, RefreshSchedule
+
+# Locations fetched at the same time by a WeatherRefresher
+FETCH_WORKERS = 10
+# Seconds: stores due this soon are fetched with the ones due now
+FETCH_WINDOW = 2
+
+resources_path = Path(__file__).resolve().parents[1].joinpath("resources")
+SNAPSHOT_NAME = "weather_{}_{}.json.gz"
+
+
+class WeatherStore:
+
+    def __init__(self, lat=54.9981, lon=-7.3093, schedule=None, snapshot_path=None):
+        self.lat = lat
+        self.lon = lon
+        self.schedule = RefreshSchedule() if schedule is None else schedule
+        # Where the last good response is kept on disk (None: not kept)
+        self.snapshot_path = snapshot_path
+        self._forecast = None
+        # time.monotonic() when each dataset was requested, None until there is one
+        self._fetched_at = dict.fromkeys(DATASETS)
+        # "exclude" of the request each dataset last came from: a 304 to that same
+        # request means the data held is still current
+        self._sources = dict.fromkeys(DATASETS)
+        self._forced = False        # expire() was called: fetch everything, now
+        self._lock = threading.Lock()
+        self._in_flight = None      # threading.Event set when the running fetch finishes
+        self.refresher = None       # WeatherRefresher fetching in the background, if any
+
+    @property
+    def forecast(self):
+        """The latest Forecast (or None), without any network access."""
+        return self._forecast
+
+    def ages(self):
+        """Seconds since each dataset was requested, None for the missing ones."""
+        now = time.monotonic()
+        return {name: None if fetched_at is None else now - fetched_at
+                for name, fetched_at in self._fetched_at.items()}
+
+    def age(self, dataset="current"):
+        return self.ages()[dataset]
+
+    def next_fetch(self):
+        """Seconds until the schedule wants the next fetch, 0 if it is due."""
+        return self.schedule.next_call(self.ages(), self._forced)
+
+    def is_due(self):
+        return self.next_fetch() <= 0
+
+    def is_stale(self):
+        """True if some of the data is missing or has missed refreshes (fetches failing)."""
+        return self.schedule.is_stale(self.ages())
+
+    def get(self):
+        """Return the Forecast, fetching first if the schedule says a fetch is due.
+
+        With a refresher running this never blocks: the refresher is asked to fetch
+        and the current data is returned straight away.
+        """
+        if self.is_due():
+            if self.refresher is not None:
+                self.refresher.wake()
+                return self._forecast
+            return self.refresh()
+        return self._forecast
+
+    def refresh(self):
+        """Fetch now, or wait for a fetch already in flight. Returns the (possibly unchanged) Forecast."""
+        with self._lock:
+            in_flight = self._in_flight
+            if in_flight is None:
+                self._in_flight = threading.Event()
+        if in_flight is not None:
+            in_flight.wait()
+            return self._forecast
+
+        started = time.monotonic()
+        requested = time.time()
+        weather = forecast = None
+        datasets = ()
+        try:
+            ages = dict.fromkeys(DATASETS) if self._forced else self.ages()
+            wanted = self.schedule.plan(ages)
+            exclude = self.schedule.exclude(wanted)
+            conditional = self._forecast is not None and all(self._sources[name] == exclude for name in wanted)
+            response = utils.get_weather_data(self.lat, self.lon, exclude=exclude, conditional=conditional)
+            # None: the request never reached the server (network down), which costs no quota
+            sent = response is not None
+            status = response.status if sent else None
+            if conditional and status == 304:
+                # Not modified: the data held is the latest
+                forecast = self._forecast
+                datasets = wanted
+                self.schedule.record_call(sent, True, status)
+                self.schedule.record_result(datasets, set())
+            else:
+                weather = response.data if sent else None
+                forecast = parse_forecast(weather, self._forecast)
+                self.schedule.record_call(sent, forecast is not None, status)
+                if forecast is not None:
+                    datasets = [name for name in DATASETS if name in weather]
+                    changed = forecast.changes(self._forecast)
+                    self.schedule.record_result(datasets, changed)
+                    if not changed:
+                        # Same data as on screen: keep the Forecast the pages already show
+                        forecast = self._forecast
+        finally:
+            with self._lock:
+                if forecast is not None:
+                    self._forecast = forecast
+                    # Aged from the request
+                    for name in datasets:
+                        self._fetched_at[name] = started
+                        self._sources[name] = exclude
+                    self._forced = False
+                in_flight, self._in_flight = self._in_flight, None
+            in_flight.set()
+        # The raw response is only kept for as long as it takes to write it out
+        if weather is not None and forecast is not None and self.snapshot_path is not None:
+            self.save_snapshot(weather, requested)
+        return self._forecast
+
+    def publish(self, weather, fetched_at=None):
+        """Replace the data with a response obtained elsewhere (requested at fetched_at, default now)."""
+        forecast = parse_forecast(weather, self._forecast)
+        if forecast is None:
+            return
+        fetched_at = time.monotonic() if fetched_at is None else fetched_at
+        with self._lock:
+            self._forecast = forecast
+            for name in DATASETS:
+                if name in weather:
+                    self._fetched_at[name] = fetched_at
+                    self._sources[name] = None
+
+    def expire(self):
+        """Make the next get() fetch every dataset, whatever their age and the quota spacing."""
+        with self._lock:
+            self._forced = True
+        if self.refresher is not None:
+            self.refresher.wake()
+
+    def save_snapshot(self, weather, requested):
+        # The datasets the response left out stay as they are in the file
+        path = Path(self.snapshot_path)
+        snapshot = {"requested": {}, "weather": {}}
+        if path.exists():
+            snapshot = read_snapshot(path) or snapshot
+        for name in DATASETS:
+            if name in weather:
+                snapshot["weather"][name] = weather[name]
+                snapshot["requested"][name] = requested
+        # Write next to the snapshot and rename, so a crash never leaves half a file
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+                        gz.write(json.dumps(snapshot, separators=(",", ":")).encode("utf-8"))
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, str(path))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as ex:
+            print("Could not save weather snapshot: ", ex)
+
+    def load_snapshot(self):
+        """Take the data from the snapshot, unless there is data already. Returns True if loaded."""
+        snapshot = read_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return False
+        weather = snapshot["weather"]
+        forecast = parse_forecast(weather)
+        if forecast is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if self._forecast is not None:
+                return False
+            self._forecast = forecast
+            for name, requested in snapshot["requested"].items():
+                if name in weather:
+                    # Keep its age, so a snapshot from just before a restart counts as fresh
+                    self._fetched_at[name] = now - max(time.time() - requested, 0.0)
+        return True
+
+
+def read_snapshot(path):
+    """The snapshot at path as {"requested": {dataset: time}, "weather": {dataset: data}}, or None."""
+    try:
+        with gzip.open(str(path), "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        weather = snapshot["weather"]
+        requested = snapshot["requested"]
+        if not isinstance(requested, dict):
+            # Written when the whole response was fetched at once: one time for everything
+            requested = dict.fromkeys(DATASETS, requested)
+        return {"requested": {name: float(requested[name]) for name in DATASETS if name in requested},
+                "weather": {name: weather[name] for name in DATASETS if name in weather}}
+    except (OSError, ValueError, KeyError, TypeError) as ex:
+        print("No weather snapshot loaded: ", ex)
+        return None
+
+
+def parse_forecast(weather, previous=None):
+    """Forecast for a onecall response (updating previous), None (and a message) if it is not a usable one."""
+    if not utils.validate_weather_data(weather):
+        if weather is not None:
+            print("Could not validate weather data json.", weather)
+        return None
+    try:
+        return Forecast(weather, previous)
+    except (KeyError, IndexError, TypeError, ValueError) as ex:
+        print("An exception ocurred while parsing weather", ex)
+        return None
+
+
+class WeatherRefresher(threading.Thread):
+    """Keeps WeatherStores fresh from a background thread. Call start() to begin and stop() to end.
+
+    The stores that are due together (e.g. one per location) are fetched concurrently
+    by a pool of "workers" threads, so a refresh of all of them takes about as long as
+    the slowest request rather than the sum of all of them.
+    """
+
+    def __init__(self, stores, workers=FETCH_WORKERS):
+        super().__init__(name="weather-refresh", daemon=True)
+        self._stores = list(stores)
+        self._workers = max(min(workers, len(self._stores)), 1)
+        self._executor = None
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="weather-fetch")
+        for store in self._stores:
+            store.refresher = self
+        super().start()
+
+    def stop(self):
+        for store in self._stores:
+            store.refresher = None
+        self._stop_event.set()
+        self._wake.set()
+        if self.is_alive():
+            self.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def wake(self):
+        """Look at the schedules again (a fetch may be due)."""
+        self._wake.set()
+
+    def refresh(self, stores):
+        """Fetch the stores concurrently and wait for all of them."""
+        jobs = [self._executor.submit(store.refresh) for store in stores]
+        for store, job in zip(stores, jobs):
+            try:
+                job.result()
+            except Exception as ex:
+                print("Exception in weather refresh of {}, {}: ".format(store.lat, store.lon), ex)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            # The schedules also hold back retries after a failed fetch and space calls for the quota
+            delays = [store.next_fetch() for store in self._stores]
+            delay = min(delays)
+            if delay > 0:
+                self._wake.wait(delay)
+                self._wake.clear()
+                continue
+            # Stores that are due in a moment come along, so the locations stay in step
+            self.refresh([store for store, delay in zip(self._stores, delays) if delay <= FETCH_WINDOW])
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def weather_store(lat=54.9981, lon=-7.3093):
+    """Return the store shared by every page showing the location lat, lon.
+
+    Its forecast is there from the snapshot at startup, before any fetch. get() only
+    fetches when the refresh schedule says so, so the pages call it on every draw.
+    """
+    with _stores_lock:
+        store = _stores.get((lat, lon))
+        if store is None:
+            store = WeatherStore(lat, lon, snapshot_path=resources_path.joinpath(SNAPSHOT_NAME.format(lat, lon)))
+            if store.snapshot_path.exists():
+                store.load_snapshot()
+            _stores[(lat, lon)] = store
+        return store
+
+
+def weather_stores():
+    """Every store handed out by weather_store()."""
+    with _stores_lock:
+        return list(_stores.values())